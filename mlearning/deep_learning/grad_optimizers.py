@@ -11,18 +11,37 @@ class Adam:
         Adaptive Moment Estimation
         Maintains adaptive learning rates for each parameter (first moment)
         and an exponentially decaying average of past gradients (momentum).
+
+        inplace: bool
+            Mutates the weights and moment estimates with out= ufuncs
+            instead of returning new arrays, so views of the weights
+            stay attached to them
     """
+    # Arrays of a parameter's size kept for each parameter
+    state_slots = 2
 
-    def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999, eps=1e-8):
+    def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999, eps=1e-8,
+                 inplace=False):
         self.learning_rate = learning_rate
         self.epsilon = eps
         # Rates of decay
         self.beta1 = beta1
         self.beta2 = beta2
+        self.inplace = inplace
 
         # First and second moment estimates
         self.mean = None
         self.uncentered_variance = None
+        # Number of updates made, for the bias correction
+        self.timestep = 0
+        self.scratch = None
+
+    def bias_corrections(self, timestep):
+        """
+            Gives the terms that unbias the first and second moment
+            estimates after the given number of updates
+        """
+        return 1 - self.beta1 ** timestep, 1 - self.beta2 ** timestep
 
     def update(self, weight, grad_wrt_weight):
         """
@@ -32,9 +51,20 @@ class Adam:
 
         if self.mean is None:
                 # or self.uncentered_variance is None:
-            self.mean = numpy.zeros(numpy.shape(grad_wrt_weight))
+            # Moments are kept in the precision of the weights
+            dtype = numpy.result_type(weight)
+            self.mean = numpy.zeros(numpy.shape(grad_wrt_weight), dtype=dtype)
             self.uncentered_variance = numpy.zeros(
-                numpy.shape(grad_wrt_weight))
+                numpy.shape(grad_wrt_weight), dtype=dtype)
+        self.timestep += 1
+
+        if self.inplace:
+            if self.scratch is None:
+                self.scratch = numpy.empty_like(self.mean)
+
+            return self.fused_step(weight, grad_wrt_weight, self.mean,
+                                   self.uncentered_variance, self.timestep,
+                                   self.scratch)
 
         # Compute decaying averages of past and past squared gradients
 
@@ -42,9 +72,74 @@ class Adam:
         self.uncentered_variance = self.beta2 * self.uncentered_variance + \
             (1 - self.beta2) * numpy.power(grad_wrt_weight, 2)
 
-        bias_corrected_mean = self.mean / (1 - self.beta1)
-        bias_corrected_variance = self.uncentered_variance / (1 - self.beta2)
+        mean_correction, variance_correction = self.bias_corrections(
+            self.timestep)
+        bias_corrected_mean = self.mean / mean_correction
+        bias_corrected_variance = self.uncentered_variance / \
+            variance_correction
         updated_weight = self.learning_rate * bias_corrected_mean / (
             numpy.sqrt(bias_corrected_variance) + self.epsilon)
 
         return weight - updated_weight
+
+    def update_rows(self, weight, rows, grad_wrt_rows):
+        """
+            Updates the given rows of the weights alone, from the
+            gradient of those rows. The moment estimates of the
+            other rows are left as they are instead of decaying
+            (lazy Adam), so a step costs as much as the rows it
+            touches. The weights are changed in place.
+        """
+        if self.mean is None:
+            dtype = numpy.result_type(weight)
+            self.mean = numpy.zeros(numpy.shape(weight), dtype=dtype)
+            self.uncentered_variance = numpy.zeros(
+                numpy.shape(weight), dtype=dtype)
+        self.timestep += 1
+
+        mean = self.beta1 * self.mean[rows] + \
+            (1 - self.beta1) * grad_wrt_rows
+        uncentered_variance = self.beta2 * self.uncentered_variance[rows] + \
+            (1 - self.beta2) * numpy.power(grad_wrt_rows, 2)
+        self.mean[rows] = mean
+        self.uncentered_variance[rows] = uncentered_variance
+
+        mean_correction, variance_correction = self.bias_corrections(
+            self.timestep)
+        weight[rows] -= self.learning_rate * (mean / mean_correction) / (
+            numpy.sqrt(uncentered_variance / variance_correction) +
+            self.epsilon)
+
+        return weight
+
+    def fused_step(self, weight, grad_wrt_weight, mean, uncentered_variance,
+                   timestep, scratch=None):
+        """
+            Applies the update of the given timestep in place to flat
+            weights, given flat moment estimates of the same size.
+            Runs as a few whole-array passes over one scratch
+            buffer regardless of how many tensors the arrays pack.
+        """
+        if scratch is None:
+            scratch = numpy.empty_like(weight)
+        mean_correction, variance_correction = self.bias_corrections(
+            timestep)
+
+        # Decaying averages of past and past squared gradients
+        mean *= self.beta1
+        mean += numpy.multiply(grad_wrt_weight, 1 - self.beta1, out=scratch)
+        uncentered_variance *= self.beta2
+        numpy.multiply(grad_wrt_weight, grad_wrt_weight, out=scratch)
+        scratch *= 1 - self.beta2
+        uncentered_variance += scratch
+
+        # lr * (mean / mean_correction) /
+        #   (sqrt(uncentered_variance / variance_correction) + eps)
+        numpy.divide(uncentered_variance, variance_correction, out=scratch)
+        numpy.sqrt(scratch, out=scratch)
+        scratch += self.epsilon
+        numpy.divide(mean, scratch, out=scratch)
+        scratch *= self.learning_rate / mean_correction
+        weight -= scratch
+
+        return weight
@@ -1,6 +1,13 @@
 """
     This moddule contains  activation functions that are
     used to give the output of the network from the biased inputs.
+    Functions whose derivative can be expressed through their own
+    output also provide grad_from_output(y), which lets the
+    backward pass reuse the forward output.
+    Every function takes an optional out array, other than its
+    input, to write the activation into.
+    flops is a rough count of the floating point operations
+    each function spends per element.
 """
 
 import numpy as np
@@ -12,17 +19,18 @@ class Rectified_Linear_Units:
         0 : x < 0
         1 : x >= 0
     """
+    flops = 1
 
     def __init__(self):
         # Too long for fit display
         self.__class__.__name__ = 'ReLu'
 
-    def __call__(self, x):
+    def __call__(self, x, out=None):
         """
                 Runs a ReLu function for given input and
                 returs the ouput
         """
-        return np.where(x >= 0, x, 0)
+        return np.maximum(x, 0, out=out)
 
     def grad(self, x):
         """
@@ -30,7 +38,7 @@ class Rectified_Linear_Units:
            (ReLu : 0 < x 1)
 
         """
-        return np.where(x >= 0, 1, 0)
+        return (x >= 0).astype(x.dtype)
 
 
 class Sigmoid:
@@ -39,12 +47,20 @@ class Sigmoid:
         Exists between 0 and 1 therefore usefull in predicting
         probability
     """
+    flops = 4
 
-    def __call__(self, x):
-        return 1 / (1 + np.exp(-x))
+    def __call__(self, x, out=None):
+        out = np.negative(x, out=out)
+        np.exp(out, out=out)
+        out += 1
+
+        return np.reciprocal(out, out=out)
 
     def grad(self, x):
-        return self.__call__(x) * (1 - self.__call__(x))
+        return self.grad_from_output(self.__call__(x))
+
+    def grad_from_output(self, y):
+        return y * (1 - y)
 
 
 class SoftMax:
@@ -52,13 +68,19 @@ class SoftMax:
         SoftMax activation function
         : exp(x)/ sum of exp(x)
     """
+    flops = 5
 
-    def __call__(self, x):
-        exp = np.exp(x - np.max(x, axis=-1, keepdims=True))
-        return exp / np.sum(exp, axis=-1, keepdims=True)
+    def __call__(self, x, out=None):
+        exp = np.subtract(x, np.max(x, axis=-1, keepdims=True), out=out)
+        np.exp(exp, out=exp)
+        exp /= np.sum(exp, axis=-1, keepdims=True)
+
+        return exp
 
     def grad(self, x):
-        prob = self.__call__(x)
+        return self.grad_from_output(self.__call__(x))
+
+    def grad_from_output(self, prob):
         return prob * (1 - prob)
 
 
@@ -68,12 +90,22 @@ class TanH:
         -1 to 1
         : (2 / [1 - exp(-2x)]) -1
     """
+    flops = 5
 
-    def __call__(self, x):
-        return 2 / (1 + np.exp(-2 * x)) - 1
+    def __call__(self, x, out=None):
+        out = np.multiply(x, -2, out=out)
+        np.exp(out, out=out)
+        out += 1
+        np.divide(2, out, out=out)
+        out -= 1
+
+        return out
 
     def grad(self, x):
-        return 1 - np.power(self.__call__(x), 2)
+        return self.grad_from_output(self.__call__(x))
+
+    def grad_from_output(self, y):
+        return 1 - np.power(y, 2)
 
 
 class LeakyReLu:
@@ -83,15 +115,23 @@ class LeakyReLu:
         inf : x < 0
         1 : x >= 0
     """
+    flops = 2
 
     def __init__(self, alpha=0.2):
         self.alpha = alpha
 
-    def __call__(self, x):
-        return np.where(x >= 0, x, self.alpha * x)
+    def __call__(self, x, out=None):
+        out = np.multiply(x, self.alpha, out=out)
+        np.copyto(out, x, where=x >= 0)
+
+        return out
 
     def grad(self, x):
-        return np.where(x >= 0, 1, self.alpha)
+        return np.where(x >= 0, 1, self.alpha).astype(x.dtype, copy=False)
+
+    def grad_from_output(self, y):
+        # y keeps the sign of x
+        return self.grad(y)
 
 
 class ELU:
@@ -100,16 +140,26 @@ class ELU:
         alpha(exp(x) - 1): x < 0
         x : x >= 0
     """
+    flops = 4
 
     def __init__(self, alpha=0.1):
         self.alpha = alpha
 
-    def __call__(self, x):
-        return np.where(x >= 0.0, x, self.alpha * (np.exp(x) - 1))
+    def __call__(self, x, out=None):
+        out = np.exp(x, out=out)
+        out -= 1
+        out *= self.alpha
+        np.copyto(out, x, where=x >= 0.0)
+
+        return out
 
     def grad(self, x):
         return np.where(x >= 0.0, 1, self.__call__(x) + self.alpha)
 
+    def grad_from_output(self, y):
+        # alpha * exp(x) == y + alpha for x < 0
+        return np.where(y >= 0.0, 1, y + self.alpha)
+
 
 class SELU:
     """
@@ -117,17 +167,28 @@ class SELU:
         alpha(exp(x) - 1): x < 0
         x : x >= 0
     """
+    flops = 5
 
     def __init__(self, alpha, scale):
         self.alpha = alpha or 1.6732632423543772848170429916717
         self.scale = scale or 1.0507009873554804934193349852946
 
-    def __call__(self, x):
-        return self.scale * np.where(x >= 0.0, x, self.alpha * (np.exp(x) - 1))
+    def __call__(self, x, out=None):
+        out = np.exp(x, out=out)
+        out -= 1
+        out *= self.alpha
+        np.copyto(out, x, where=x >= 0.0)
+        out *= self.scale
+
+        return out
 
     def grad(self, x):
         return self.scale * np.where(x >= 0.0, 1, self.alpha * np.exp(x))
 
+    def grad_from_output(self, y):
+        # scale * alpha * exp(x) == y + scale * alpha for x < 0
+        return np.where(y >= 0.0, self.scale, y + self.scale * self.alpha)
+
 
 class SoftPlus:
     """
@@ -135,12 +196,22 @@ class SoftPlus:
         ln(1 + exp(x))
         log(exp)[1 + exp(x)]
     """
+    flops = 4
 
-    def __call__(self, x):
-        return np.log(1 + np.exp(x))
+    def __call__(self, x, out=None):
+        out = np.exp(x, out=out)
+        out += 1
+
+        return np.log(out, out=out)
 
     def grad(self, x):
         """
             f`(x) = 1 / (1 + exp(-x))
         """
         return 1 / (1 + np.exp(-x))
+
+    def grad_from_output(self, y):
+        """
+            f`(x) = 1 - exp(-f(x))
+        """
+        return -np.expm1(-y)
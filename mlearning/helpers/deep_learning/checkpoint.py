@@ -0,0 +1,174 @@
+"""
+    This module contains the periodic training checkpoints that let
+    an interrupted run resume where it stopped.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from .serialization import (saved_arrays, optimizer_arrays,
+                            restore_optimizer_arrays)
+
+
+CHECKPOINT_FILE = 'checkpoint.npz'
+
+
+class Checkpointer:
+    """
+        Saves the weights, optimizer moments, numpy RNG state and
+        loss history of a group of networks every few epochs.
+
+        The state is copied on the training thread, which is cheap
+        next to an epoch, and written to disk by a background
+        thread. Each write goes to a temporary file that replaces
+        the previous checkpoint in one rename, so an interruption
+        mid-write leaves the last complete checkpoint in place.
+
+        Parameters
+        ----------
+        path: str
+            Directory holding the checkpoint
+        interval: int
+            Number of epochs between checkpoints
+    """
+
+    def __init__(self, path, interval=1):
+        if interval < 1:
+            raise ValueError(f'Checkpoint interval must be positive: '
+                             f'{interval}')
+        self.path = path
+        self.interval = interval
+        self.writer = None
+        self.error = None
+
+    @property
+    def file_path(self):
+        return os.path.join(self.path, CHECKPOINT_FILE)
+
+    def exists(self):
+        """
+            Checks whether a complete checkpoint has been written
+        """
+        return os.path.exists(self.file_path)
+
+    def snapshot(self, networks, epoch, progress=None):
+        """
+            Copies the training state of the named networks.
+            progress holds any JSON-encodable values the training
+            loop needs back on resume
+        """
+        state = {}
+
+        for network_name, network in networks.items():
+            prefix = f'{network_name}/'
+            for index, layer in enumerate(network.input_layers):
+                for name, array in saved_arrays(layer):
+                    state[f'{prefix}{index}.{name}'] = np.array(array)
+            state.update(optimizer_arrays(network, prefix))
+            for kind, errs in network.errs.items():
+                state[f'{prefix}errs.{kind}'] = np.array(errs, dtype=float)
+
+        algorithm, keys, position, has_gauss, cached_gaussian = \
+            np.random.get_state()
+        state.update({'rng.algorithm': np.array(algorithm),
+                      'rng.keys': keys,
+                      'rng.position': np.array(position),
+                      'rng.has_gauss': np.array(has_gauss),
+                      'rng.cached_gaussian': np.array(cached_gaussian)})
+        state['progress'] = np.array(json.dumps(
+            {'epoch': epoch, 'progress': progress or {}}))
+
+        return state
+
+    def write(self, state):
+        """
+            Writes a snapshot over the checkpoint in one rename
+        """
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = self.file_path + '.tmp'
+
+        with open(temp_path, 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **state)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.file_path)
+
+    def save(self, networks, epoch, progress=None, wait=False):
+        """
+            Snapshots the networks and writes the checkpoint in the
+            background. A write still running from the previous save
+            is waited for before the copy is taken, so at most one
+            snapshot is held
+        """
+        self.wait()
+        state = self.snapshot(networks, epoch, progress)
+
+        def write():
+            try:
+                self.write(state)
+            except Exception as error:
+                self.error = error
+
+        self.writer = threading.Thread(target=write, daemon=True)
+        self.writer.start()
+
+        if wait:
+            self.wait()
+
+    def on_epoch_end(self, networks, epoch, no_of_epochs, progress=None):
+        """
+            Saves a checkpoint when the epoch completes an interval,
+            and after the last epoch
+        """
+        if not (epoch + 1) % self.interval or epoch + 1 == no_of_epochs:
+            self.save(networks, epoch, progress)
+
+    def wait(self):
+        """
+            Blocks until the pending write is on disk, raising any
+            error it met
+        """
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def restore(self, networks):
+        """
+            Loads the checkpoint into the named networks in place and
+            resets the numpy RNG.
+            Returns the epoch to resume from, which is 0 without a
+            checkpoint, and the saved progress values
+        """
+        self.wait()
+        if not self.exists():
+            return 0, {}
+
+        with np.load(self.file_path) as state:
+            for network_name, network in networks.items():
+                prefix = f'{network_name}/'
+                for index, layer in enumerate(network.input_layers):
+                    for name in layer.params + layer.buffers:
+                        key = f'{prefix}{index}.{name}'
+                        if key in state:
+                            setattr(layer, name, np.array(state[key]))
+                if network.flat_params is not None:
+                    network.flat_params.repack()
+                restore_optimizer_arrays(network, state, prefix)
+                for kind in network.errs:
+                    network.errs[kind] = list(
+                        state[f'{prefix}errs.{kind}'])
+
+            np.random.set_state((str(state['rng.algorithm']),
+                                 state['rng.keys'],
+                                 int(state['rng.position']),
+                                 int(state['rng.has_gauss']),
+                                 float(state['rng.cached_gaussian'])))
+            saved = json.loads(str(state['progress']))
+
+        return saved['epoch'] + 1, saved['progress']
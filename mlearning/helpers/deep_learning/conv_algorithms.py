@@ -0,0 +1,287 @@
+"""
+    This module contains the algorithms that compute the forward
+    pass of a two dimensional convolution layer.
+    Every algorithm takes images of shape
+    (batch_size, channels, height, width), filters of shape
+    (no_of_filters, channels, filter_height, filter_width), the stride
+    and the ((top, bottom), (left, right)) padding, and returns the
+    unbiased output of shape
+    (batch_size, no_of_filters, output_height, output_width).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+# Winograd F(2x2, 3x3) transforms
+WINOGRAD_B_T = np.array([[1, 0, -1, 0],
+                         [0, 1, 1, 0],
+                         [0, -1, 1, 0],
+                         [0, 1, 0, -1]])
+WINOGRAD_G = np.array([[1, 0, 0],
+                       [.5, .5, .5],
+                       [.5, -.5, .5],
+                       [0, 0, 1]])
+WINOGRAD_A_T = np.array([[1, 1, 1, 0],
+                         [0, 1, -1, -1]])
+
+# Number of convolution geometries whose autotuned algorithm is kept
+AUTOTUNE_CACHE_SIZE = 64
+
+# Algorithm chosen for each timed convolution geometry, least
+# recently used first
+autotuned_algorithms = OrderedDict()
+autotune_lock = threading.Lock()
+
+
+def pad_images(images, padding):
+    """
+        Pads the image height and width with zeros
+    """
+    pad_h, pad_w = padding
+
+    if not (np.sum(pad_h) or np.sum(pad_w)):
+        return images
+
+    return np.pad(images, ((0, 0), (0, 0), pad_h, pad_w), mode='constant')
+
+
+def image_windows(images, fltr_shape, stride):
+    """
+        Gives a read-only sliding-window view of already padded images
+        with shape (batch_size, channels, filter_height, filter_width,
+        output_height, output_width).
+        No patch is copied; each window shares memory with the images.
+    """
+    fltr_height, fltr_width = fltr_shape
+    batch_size, channels, height, width = images.shape
+    out_height = (height - fltr_height) // stride + 1
+    out_width = (width - fltr_width) // stride + 1
+    str_b, str_c, str_h, str_w = images.strides
+
+    return as_strided(images,
+                      shape=(batch_size, channels, fltr_height,
+                             fltr_width, out_height, out_width),
+                      strides=(str_b, str_c, str_h, str_w,
+                               str_h * stride, str_w * stride),
+                      writeable=False)
+
+
+def window_offsets(images, fltr_shape, stride):
+    """
+        Yields each filter offset (i, j) with the view of the already
+        padded images that the filter weights at that offset multiply,
+        of shape (batch_size, channels, output_height, output_width)
+    """
+    windows = image_windows(images, fltr_shape, stride)
+
+    for i in range(fltr_shape[0]):
+        for j in range(fltr_shape[1]):
+            yield i, j, windows[:, :, i, j]
+
+
+def matmul_convolve(images, weight, stride, padding):
+    """
+        Convolves as one matrix product between the filters and the
+        image patches per filter offset, summed. Each product reads
+        a strided view of the images, so only one offset's patches
+        are ever gathered at a time rather than the column matrix
+        of all of them
+    """
+    no_of_filters, channels = weight.shape[:2]
+    output = term = None
+
+    for i, j, window in window_offsets(
+            pad_images(images, padding), weight.shape[2:], stride):
+        batch_size, _, out_height, out_width = window.shape
+        columns = window.transpose(1, 0, 2, 3).reshape((channels, -1))
+        if output is None:
+            output = weight[:, :, i, j].dot(columns)
+            term = np.empty_like(output)
+        else:
+            np.dot(weight[:, :, i, j], columns, out=term)
+            output += term
+
+    return output.reshape((no_of_filters, batch_size, out_height,
+                           out_width)).transpose(1, 0, 2, 3)
+
+
+def convolution_weight_gradient(images, grad, fltr_shape, stride, padding):
+    """
+        Gives the gradient of the filters from the images and the
+        gradient of the unbiased output, one filter offset at a time
+    """
+    no_of_filters, channels = grad.shape[1], images.shape[1]
+    grad_weight = np.empty((no_of_filters, channels) + tuple(fltr_shape),
+                           dtype=np.result_type(images, grad))
+    grad_col = grad.transpose(1, 0, 2, 3).reshape((no_of_filters, -1))
+
+    for i, j, window in window_offsets(
+            pad_images(images, padding), fltr_shape, stride):
+        columns = window.transpose(1, 0, 2, 3).reshape((channels, -1))
+        grad_weight[:, :, i, j] = grad_col.dot(columns.T)
+
+    return grad_weight
+
+
+def convolution_input_gradient(grad, weight, images_shape, stride, padding):
+    """
+        Gives the gradient of the images from the gradient of the
+        output, scattering one filter offset at a time into strided
+        slices of the padded images
+    """
+    (pad_top, pad_bottom), (pad_left, pad_right) = padding
+    batch_size, channels, height, width = images_shape
+    _, no_of_filters, out_height, out_width = grad.shape
+
+    images_grad = np.zeros(
+        (batch_size, channels, height + pad_top + pad_bottom,
+         width + pad_left + pad_right),
+        dtype=np.result_type(grad, weight))
+    grad_rows = grad.transpose(0, 2, 3, 1).reshape((-1, no_of_filters))
+    term = np.empty((grad_rows.shape[0], channels), dtype=images_grad.dtype)
+
+    for i in range(weight.shape[2]):
+        for j in range(weight.shape[3]):
+            np.dot(grad_rows, weight[:, :, i, j], out=term)
+            images_grad[:, :, i:i + stride * (out_height - 1) + 1:stride,
+                        j:j + stride * (out_width - 1) + 1:stride] += \
+                term.reshape((batch_size, out_height, out_width,
+                              channels)).transpose(0, 3, 1, 2)
+
+    return images_grad[:, :, pad_top:pad_top + height,
+                       pad_left:pad_left + width]
+
+
+def fft_convolve(images, weight, stride, padding):
+    """
+        Convolves through a product of the image and filter spectra.
+        The padded image size is used as the transform size, since
+        valid output positions never wrap around the image.
+    """
+    images = pad_images(images, padding)
+    height, width = images.shape[2:]
+    fltr_height, fltr_width = weight.shape[2:]
+
+    images_freq = np.fft.rfft2(images)
+    weight_freq = np.conj(np.fft.rfft2(weight, s=(height, width)))
+
+    # Sum the per-channel products for each filter
+    output_freq = np.einsum('bcuv,fcuv->bfuv', images_freq, weight_freq)
+    output = np.fft.irfft2(output_freq, s=(height, width))
+
+    return output[:, :, :height - fltr_height + 1:stride,
+                  :width - fltr_width + 1:stride].astype(images.dtype)
+
+
+def winograd_convolve(images, weight, stride, padding):
+    """
+        Convolves 3x3 filters at stride 1 with the Winograd F(2x2, 3x3)
+        minimal filtering algorithm.
+        Each 4x4 input tile gives a 2x2 output tile from 16
+        multiplications per channel instead of 36.
+    """
+    images = pad_images(images, padding)
+    batch_size, channels, height, width = images.shape
+    no_of_filters = weight.shape[0]
+    out_height, out_width = height - 2, width - 2
+
+    # Pad to a whole number of 2x2 output tiles
+    tiles_h, tiles_w = -(-out_height // 2), -(-out_width // 2)
+    images = np.pad(images, ((0, 0), (0, 0),
+                             (0, 2 * tiles_h + 2 - height),
+                             (0, 2 * tiles_w + 2 - width)), mode='constant')
+
+    # Overlapping 4x4 tiles: (batch, channels, tiles_h, tiles_w, 4, 4)
+    str_b, str_c, str_h, str_w = images.strides
+    tiles = as_strided(images,
+                       shape=(batch_size, channels, tiles_h, tiles_w, 4, 4),
+                       strides=(str_b, str_c, 2 * str_h, 2 * str_w,
+                                str_h, str_w),
+                       writeable=False)
+
+    b_t = WINOGRAD_B_T.astype(images.dtype)
+    g = WINOGRAD_G.astype(images.dtype)
+    a_t = WINOGRAD_A_T.astype(images.dtype)
+
+    # Transform the filters and the tiles into the Winograd domain
+    weight_wino = np.einsum('ij,fcjk,lk->ilcf', g, weight, g,
+                            optimize=True)
+    tiles_wino = np.einsum('ij,bcxyjk,lk->ilbxyc', b_t, tiles, b_t,
+                           optimize=True)
+
+    # One (tiles x channels) . (channels x filters) product per
+    # position of the 4x4 transformed tile
+    product = np.matmul(
+        tiles_wino.reshape(16, -1, channels),
+        weight_wino.reshape(16, channels, no_of_filters)
+    ).reshape(4, 4, batch_size, tiles_h, tiles_w, no_of_filters)
+
+    # Inverse transform into 2x2 output tiles
+    output = np.einsum('ij,jkbxyf,lk->bfxiyl', a_t, product, a_t,
+                       optimize=True)
+    output = output.reshape(batch_size, no_of_filters,
+                            2 * tiles_h, 2 * tiles_w)
+
+    return output[:, :, :out_height, :out_width]
+
+
+def supports_algorithm(name, fltr_shape, stride):
+    """
+        Checks whether the algorithm can compute a convolution
+        of the given filter shape and stride
+    """
+    if name == 'winograd':
+        return tuple(fltr_shape) == (3, 3) and stride == 1
+
+    return name in convolution_algorithms
+
+
+def autotune_algorithm(images, weight, stride, padding, overrides=None):
+    """
+        Times each supported algorithm on the given convolution and
+        remembers the fastest for its geometry, keeping the
+        AUTOTUNE_CACHE_SIZE most recently used geometries.
+        overrides maps algorithm names to the convolutions the
+        caller runs in their place, such as a gather im2col for
+        'matmul', so that the timed path is the one that will run.
+        Each candidate runs once untimed first, so one-off setup
+        costs do not decide the choice.
+        Returns the name of the chosen algorithm
+    """
+    overrides = overrides or {}
+    key = (images.shape, images.dtype.str, weight.shape, stride, padding,
+           tuple(sorted(overrides)))
+
+    with autotune_lock:
+        if key in autotuned_algorithms:
+            autotuned_algorithms.move_to_end(key)
+            return autotuned_algorithms[key]
+
+    timings = {}
+    for name, algorithm in convolution_algorithms.items():
+        if not supports_algorithm(name, weight.shape[2:], stride):
+            continue
+        algorithm = overrides.get(name, algorithm)
+        algorithm(images, weight, stride, padding)
+        start = time.perf_counter()
+        algorithm(images, weight, stride, padding)
+        timings[name] = time.perf_counter() - start
+    fastest = min(timings, key=timings.get)
+
+    with autotune_lock:
+        autotuned_algorithms[key] = fastest
+        while len(autotuned_algorithms) > AUTOTUNE_CACHE_SIZE:
+            autotuned_algorithms.popitem(last=False)
+
+    return fastest
+
+
+convolution_algorithms = {
+    'matmul': matmul_convolve,
+    'fft': fft_convolve,
+    'winograd': winograd_convolve
+}
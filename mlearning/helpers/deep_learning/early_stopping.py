@@ -0,0 +1,113 @@
+"""
+    This module contains the early stopping rule that ends training
+    once the validation loss stops improving.
+"""
+import numpy as np
+
+from .serialization import saved_arrays
+
+
+class EarlyStopping:
+    """
+        Stops training when the validation loss has not improved for
+        a number of validations, and can put back the weights of the
+        best one.
+
+        The best weights are copied in memory each time the loss
+        improves, which costs one copy of the parameters. They are
+        not part of a checkpoint, so a resumed run puts back only
+        the best weights found after resuming.
+
+        Parameters
+        ----------
+        patience: int
+            Number of validations without improvement to allow
+            before stopping
+        min_delta: float
+            Least decrease of the validation loss that counts as
+            an improvement
+        restore_best_weights: bool
+            Puts back the weights of the best validation when
+            training ends
+    """
+
+    def __init__(self, patience=5, min_delta=0.0, restore_best_weights=True):
+        if patience < 0:
+            raise ValueError(f'Patience must not be negative: {patience}')
+        self.patience = patience
+        self.min_delta = min_delta
+        self.restore_best_weights = restore_best_weights
+        self.reset()
+
+    def reset(self):
+        """
+            Forgets the losses seen, for a new training run
+        """
+        self.best_loss = np.inf
+        self.best_epoch = None
+        self.best_weights = None
+        self.wait = 0
+        self.stopped_epoch = None
+
+    def get_progress(self):
+        """
+            Gives the counters a checkpoint saves to resume the rule
+        """
+        return {'best_loss': float(self.best_loss),
+                'best_epoch': self.best_epoch,
+                'wait': self.wait,
+                'stopped_epoch': self.stopped_epoch}
+
+    def set_progress(self, progress):
+        """
+            Puts back the counters given by get_progress
+        """
+        self.reset()
+        self.best_loss = progress['best_loss']
+        self.best_epoch = progress['best_epoch']
+        self.wait = progress['wait']
+        self.stopped_epoch = progress['stopped_epoch']
+
+    def snapshot(self, network):
+        """
+            Copies the layer parameters and buffers of the network
+        """
+        return {(index, name): np.array(array)
+                for index, layer in enumerate(network.input_layers)
+                for name, array in saved_arrays(layer)}
+
+    def on_validation(self, network, epoch, loss):
+        """
+            Records the validation loss of the epoch.
+            Returns whether training should stop
+        """
+        if loss < self.best_loss - self.min_delta:
+            self.best_loss = loss
+            self.best_epoch = epoch
+            self.wait = 0
+            if self.restore_best_weights:
+                self.best_weights = self.snapshot(network)
+            return False
+
+        self.wait += 1
+        if self.wait > self.patience:
+            self.stopped_epoch = epoch
+            return True
+
+        return False
+
+    def restore(self, network):
+        """
+            Writes the best weights back into the network's arrays
+        """
+        if self.best_weights is None:
+            return
+
+        for (index, name), value in self.best_weights.items():
+            layer = network.input_layers[index]
+            array = getattr(layer, name, None)
+            if isinstance(array, np.ndarray) and array.shape == value.shape:
+                # Parameters may be views of the flat buffer
+                array[...] = value
+            else:
+                setattr(layer, name, np.array(value))
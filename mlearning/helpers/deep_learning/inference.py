@@ -0,0 +1,379 @@
+"""
+    This module contains the frozen execution plan that a trained
+    network compiles into for inference.
+"""
+import copy
+
+import numpy as np
+
+from ..utils.data_utils import Data
+from .sparse_inputs import as_samples
+from .activation_functions import (Rectified_Linear_Units, Sigmoid, SoftMax,
+                                   TanH, LeakyReLu)
+from .conv_algorithms import (convolution_algorithms, autotune_algorithm,
+                              pad_images)
+from .layers import (ConvolutionTwoD, Activation, DropOut,
+                     BatchNormalization, Flatten, Reshape, Dense)
+
+
+data_helper = Data()
+
+
+def frozen(array, dtype):
+    """
+        Gives a read-only copy of the array in the plan dtype
+    """
+    array = np.array(array, dtype=dtype)
+    array.setflags(write=False)
+
+    return array
+
+
+def is_identity(scale, shift):
+    """
+        Checks whether x * scale + shift leaves x unchanged
+    """
+    return not (np.ndim(scale) or np.ndim(shift)) and \
+        scale == 1 and shift == 0
+
+
+def softmax_inplace(x):
+    x -= np.max(x, axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= np.sum(x, axis=-1, keepdims=True)
+
+    return x
+
+
+def sigmoid_inplace(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+
+    return np.reciprocal(x, out=x)
+
+
+def inplace_activation(activation_func):
+    """
+        Gives a kernel that overwrites its input with the
+        activation output, or None when the function has none
+    """
+    if isinstance(activation_func, Rectified_Linear_Units):
+        return lambda x: np.maximum(x, 0, out=x)
+    if isinstance(activation_func, LeakyReLu) and \
+            0 <= activation_func.alpha <= 1:
+        alpha = activation_func.alpha
+        return lambda x: np.maximum(x, alpha * x, out=x)
+    if isinstance(activation_func, TanH):
+        return lambda x: np.tanh(x, out=x)
+    if isinstance(activation_func, Sigmoid):
+        return sigmoid_inplace
+    if isinstance(activation_func, SoftMax):
+        return softmax_inplace
+
+    return None
+
+
+class ActivationStep:
+    """
+        Applies an activation, in place when the input
+        belongs to the plan
+    """
+
+    def __init__(self, activation_func, inplace):
+        self.activation_func = activation_func
+        self.kernel = inplace_activation(activation_func) if inplace \
+            else None
+
+    def __call__(self, X):
+        if self.kernel is not None:
+            return self.kernel(X)
+
+        return self.activation_func(X)
+
+
+class DenseStep:
+    """
+        Dense product with the bias added and an optional
+        activation applied in place on the output
+    """
+
+    def __init__(self, weight, weight_out, dtype):
+        self.weight = frozen(weight, dtype)
+        self.weight_out = frozen(weight_out, dtype)
+        self.activation = None
+
+    def fold_affine(self, scale, shift):
+        """
+            Folds y * scale + shift of the output into the
+            weights and bias
+        """
+        dtype = self.weight.dtype
+        self.weight = frozen(self.weight * scale, dtype)
+        self.weight_out = frozen(self.weight_out * scale + shift, dtype)
+
+    def __call__(self, X):
+        # X.dot also takes sparse samples
+        output = X.dot(self.weight)
+        output += self.weight_out
+
+        return output if self.activation is None else self.activation(output)
+
+
+class ConvolutionStep:
+    """
+        Convolution with precomputed gather indices, the bias and
+        any following per-element affine folded into one
+        scale and shift, and an optional in-place activation
+    """
+
+    def __init__(self, layer, dtype):
+        self.weight = frozen(layer.weight_, dtype)
+        self.shift = frozen(layer.weight_out.reshape((-1, 1, 1)), dtype)
+        self.scale = None
+        self.activation = None
+        self.stride = layer.stride
+        self.out_height, self.out_width = layer.output_shape()[1:]
+        self.padding = layer.get_padding(layer.filter_shape, layer.padding)
+
+        self.algorithm = layer.algorithm
+        self.indices = None
+
+        if self.algorithm in ('matmul', 'auto') and \
+                layer.im2col == 'gather':
+            self.indices = layer.get_img_cols_indices(
+                (None,) + tuple(layer.input_shape), layer.filter_shape,
+                self.padding, layer.stride)
+
+    def fold_affine(self, scale, shift):
+        """
+            Folds y * scale + shift of the output into the
+            output scale and shift
+        """
+        dtype = self.weight.dtype
+        scale = np.broadcast_to(scale, self.shift.shape[:1] +
+                                (self.out_height, self.out_width))
+        self.scale = frozen(scale if self.scale is None else
+                            self.scale * scale, dtype)
+        self.shift = frozen(self.shift * scale + shift, dtype)
+
+    def gather_convolve(self, X, weight, stride, padding):
+        """
+            Unbiased convolution through the precomputed gather
+            indices, with the signature of the convolution algorithms
+        """
+        ind_k, ind_i, ind_j = self.indices
+        cols = pad_images(X, padding)[:, ind_k, ind_i, ind_j]
+
+        # (filters x patch) . (batch x patch x positions)
+        return np.matmul(weight.reshape((weight.shape[0], -1)),
+                         cols).reshape((X.shape[0], -1, self.out_height,
+                                        self.out_width))
+
+    def __call__(self, X):
+        algorithm = self.algorithm
+        if algorithm == 'auto':
+            # Time the gather path for 'matmul' when it is the one run
+            overrides = None if self.indices is None else \
+                {'matmul': self.gather_convolve}
+            algorithm = autotune_algorithm(
+                X, self.weight, self.stride, self.padding, overrides)
+
+        if algorithm == 'matmul' and self.indices is not None:
+            output = self.gather_convolve(X, self.weight, self.stride,
+                                          self.padding)
+        else:
+            output = convolution_algorithms[algorithm](
+                X, self.weight, self.stride, self.padding)
+
+        if self.scale is not None:
+            output *= self.scale
+        output += self.shift
+
+        return output if self.activation is None else self.activation(output)
+
+
+class AffineStep:
+    """
+        Per-element scale and shift left over from batch
+        normalization or dropout that no product could absorb
+    """
+
+    def __init__(self, scale, shift, dtype):
+        self.scale = frozen(scale, dtype)
+        self.shift = frozen(shift, dtype)
+
+    def __call__(self, X):
+        output = np.multiply(X, self.scale)
+        output += self.shift
+
+        return output
+
+
+class LayerStep:
+    """
+        Runs a copy of a layer that holds no weights
+    """
+
+    def __init__(self, layer):
+        self.layer = copy.copy(layer)
+
+    def __call__(self, X):
+        return self.layer.forward_pass(X, training=False)
+
+
+class InferencePlan:
+    """
+        Immutable sequence of steps that predicts with the frozen,
+        folded weights of a trained network.
+        Batch normalization running statistics and dropout scaling
+        are folded into the neighbouring products, activations run
+        in place on the product outputs and the convolution gather
+        indices are computed once.
+        The plan holds its own read-only copies of the weights, so
+        later training of the network does not change it.
+
+        Parameters
+        ----------
+        network: Neural_Network
+            Trained network to compile
+    """
+
+    def __init__(self, network):
+        dtype = network.dtype
+        steps = []
+        # Per-sample affine y = x * scale + shift waiting to be folded
+        scale, shift = 1, 0
+        # Whether the current activations are an array the plan
+        # allocated, as opposed to the caller's input or a view of it
+        owned = False
+
+        def flush(scale, shift):
+            if not is_identity(scale, shift):
+                steps.append(AffineStep(scale, shift, dtype))
+
+        for layer in network.input_layers:
+            pending = not is_identity(scale, shift)
+
+            if isinstance(layer, DropOut):
+                scale, shift = scale * (1 - layer.p), shift * (1 - layer.p)
+
+            elif isinstance(layer, BatchNormalization):
+                if layer.running_mean is None:
+                    raise ValueError(
+                        'Batch normalization has no running statistics. '
+                        'Train the network before compiling it')
+                bn_scale = layer.gamma / np.sqrt(layer.running_var +
+                                                 layer.eps)
+                bn_shift = layer.beta - layer.running_mean * bn_scale
+                previous = steps[-1] if steps else None
+
+                if not pending and \
+                        isinstance(previous, (DenseStep, ConvolutionStep)) \
+                        and previous.activation is None:
+                    previous.fold_affine(bn_scale, bn_shift)
+                else:
+                    scale, shift = scale * bn_scale, shift * bn_scale + \
+                        bn_shift
+
+            elif isinstance(layer, Dense):
+                step = DenseStep(layer.weight, layer.weight_out, dtype)
+
+                if pending:
+                    # (x * s + t) . W == x . (s W) + t . W
+                    in_shape = (int(np.prod(layer.input_shape)),)
+                    scale = np.broadcast_to(scale, in_shape)
+                    shift = np.broadcast_to(shift, in_shape)
+                    step = DenseStep(
+                        scale.reshape((-1, 1)) * layer.weight,
+                        shift.dot(layer.weight) + layer.weight_out, dtype)
+                    scale, shift = 1, 0
+                steps.append(step)
+                owned = True
+
+            elif isinstance(layer, ConvolutionTwoD):
+                if pending and not np.ndim(scale) and not np.ndim(shift) \
+                        and not shift:
+                    # Convolution is linear in its input
+                    layer = copy.copy(layer)
+                    layer.weight_ = layer.weight_ * scale
+                elif pending:
+                    flush(scale, shift)
+                scale, shift = 1, 0
+                steps.append(ConvolutionStep(layer, dtype))
+                owned = True
+
+            elif isinstance(layer, (Flatten, Reshape)):
+                if np.ndim(scale) or np.ndim(shift):
+                    in_shape = tuple(layer.input_shape)
+                    out_shape = tuple(layer.output_shape())
+                    scale = np.broadcast_to(scale, in_shape).reshape(
+                        out_shape)
+                    shift = np.broadcast_to(shift, in_shape).reshape(
+                        out_shape)
+                steps.append(LayerStep(layer))
+
+            elif isinstance(layer, Activation):
+                if pending:
+                    flush(scale, shift)
+                    scale, shift = 1, 0
+                    owned = True
+                previous = steps[-1] if steps else None
+                kernel = inplace_activation(layer.activation_func)
+
+                if not pending and kernel is not None and \
+                        isinstance(previous, (DenseStep, ConvolutionStep)) \
+                        and previous.activation is None:
+                    previous.activation = kernel
+                else:
+                    steps.append(ActivationStep(layer.activation_func,
+                                                inplace=owned))
+                    owned = True
+
+            else:
+                if pending:
+                    flush(scale, shift)
+                    scale, shift = 1, 0
+                steps.append(LayerStep(layer))
+                owned = True
+
+        flush(scale, shift)
+
+        object.__setattr__(self, 'steps', tuple(steps))
+        object.__setattr__(self, 'dtype', dtype)
+        object.__setattr__(self, 'bytes_per_sample',
+                           network.activation_bytes_per_sample())
+
+    def __setattr__(self, name, value):
+        raise AttributeError('An inference plan cannot be changed')
+
+    def run_forward_pass(self, X):
+        """
+            Runs the steps over one batch of samples
+        """
+        output = as_samples(X, self.dtype)
+        for step in self.steps:
+            output = step(output)
+
+        return output
+
+    def make_prediction(self, X, batch_size=None, max_memory=None,
+                        n_threads=1):
+        """
+            Predicts values of X.
+            Takes the same chunking options as
+            Neural_Network.make_prediction
+        """
+        if batch_size is None and max_memory is not None:
+            batch_size = max(1, int(
+                max_memory // (self.bytes_per_sample * max(1, n_threads))))
+
+        if batch_size is None or batch_size >= X.shape[0]:
+            return self.run_forward_pass(X)
+
+        return data_helper.map_over_batch(
+            self.run_forward_pass, X, batch_size, n_threads=n_threads)
+
+    def __repr__(self):
+        return 'InferencePlan(' + ', '.join(
+            type(step).__name__ for step in self.steps) + ')'
@@ -6,18 +6,49 @@ from .activation_functions import (Rectified_Linear_Units, SoftMax,
                                    TanH, LeakyReLu, SELU, Sigmoid, SoftPlus,
                                    ELU
                                    )
+from .conv_algorithms import (convolution_algorithms, supports_algorithm,
+                              autotune_algorithm, pad_images, image_windows,
+                              convolution_weight_gradient,
+                              convolution_input_gradient)
+from .sparse_inputs import nonzero_rows_product
 
 import numpy as np
+from scipy import sparse
 import copy
+import functools
 import math
 
 
+# Number of distinct convolution geometries whose im2col indices are kept
+INDEX_CACHE_SIZE = 64
+
+
 class Layer:
     """
         Parent class layer model. Only contains methods common
         to implemented layer models and does not suffice
         to create a layer.
     """
+    # Floating point type of the weights. Set by the network
+    dtype = np.dtype(np.float64)
+    # Buffer arena shared by the network's layers while training
+    workspace = None
+    # Names of the trainable parameter attributes
+    params = ()
+    # Flat gradient views the network collects gradients into
+    grad_views = None
+    # Names of the arrays kept from a training forward pass
+    # for the backward pass
+    state = ()
+    # Names of the non-trainable arrays saved with the parameters
+    buffers = ()
+    # RandomState the layer draws from. The global numpy RNG when unset
+    random_state = None
+    # Whether the forward pass returns a view of its input, which
+    # numpy can only give for a C-contiguous input
+    views_input = False
+    # Whether the forward pass output is C-contiguous
+    contiguous_output = True
 
     def set_input_shape(self, shape):
         """
@@ -26,6 +57,17 @@ class Layer:
         """
         self.input_shape = shape
 
+    def allocate(self, name, shape, dtype):
+        """
+            Gives an uninitialised array for the layer's named output.
+            The array is reused from the network workspace when one
+            is active.
+        """
+        if self.workspace is None or not self.workspace.active:
+            return np.empty(shape, dtype=dtype)
+
+        return self.workspace.get(self, name, shape, dtype)
+
     def __repr__(self):
         """
             Print representation. This is represented by
@@ -40,35 +82,102 @@ class Layer:
         """
         return 0
 
+    def activation_elements(self):
+        """
+            Gives the number of array elements per sample
+            that the forward pass creates
+        """
+        return int(np.prod(self.output_shape()))
+
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer,
+            the input shape aside
+        """
+        return {}
+
+    def estimate_flops(self):
+        """
+            Gives rough counts of the floating point operations of
+            the forward and backward passes per sample.
+            Layers that only move data count none
+        """
+        return 0, 0
+
+    def param_optimizers(self):
+        """
+            Gives the optimizers of the parameters, in the order
+            of the parameter names
+        """
+        return ()
+
+    def retained_arrays(self):
+        """
+            Gives the (name, array) pairs of the state currently held
+            for the backward pass
+        """
+        return [(name, getattr(self, name, None)) for name in self.state
+                if isinstance(getattr(self, name, None), np.ndarray)]
+
+    def release_state(self):
+        """
+            Drops the arrays held for the backward pass
+        """
+        for name in self.state:
+            setattr(self, name, None)
+
+    def update_params(self, *grads):
+        """
+            Applies the gradients of the parameters, given in the
+            order of the parameter names.
+            When the network steps all parameters at once the
+            gradients are only collected into its flat buffer.
+        """
+        if self.grad_views is not None:
+            for view, grad in zip(self.grad_views, grads):
+                view[...] = grad
+            return
+
+        for name, optimizer, grad in zip(self.params,
+                                         self.param_optimizers(), grads):
+            setattr(self, name, optimizer.update(getattr(self, name), grad))
+
     @classmethod
     def reshape_col_to_image(cls,
                              cols, imgs_shape, fltr_shape,
                              stride, output_shape=True):
         """
-            Changes shape of the input layer from column to image
-
+            Changes shape of the input layer from column to image.
+            Overlapping patches are summed one filter offset at a
+            time into strided slices of the padded images, which
+            takes filter_height * filter_width vectorised additions.
         """
         batch_size, channels, height, width = imgs_shape
+        fltr_height, fltr_width = fltr_shape
         pad_h, pad_w = cls.get_padding(fltr_shape, output_shape)
 
         padded_h = height + np.sum(pad_h)
         padded_w = width + np.sum(pad_w)
-        padded_imgs = np.empty((batch_size, channels, padded_h, padded_w))
-
-        # Calculate indices for dot product between weights
-        # and images
-
-        ind1, ind2, ind3 = cls.get_img_cols_indices(
-            imgs_shape, fltr_shape, (pad_h, pad_w), stride)
-
-        cols_reshaped = cols.reshape(
-            channels * np.product(fltr_shape), -1, batch_size)
-        cols_reshaped = cols_reshaped.transpose(2, 0, 1)
-
-        # Add column content to images at the indices
-        np.add.at(padded_imgs, (slice(None), ind1, ind2, ind3), cols_reshaped)
-
-        # Image without padding
+        out_height = (padded_h - fltr_height) // stride + 1
+        out_width = (padded_w - fltr_width) // stride + 1
+
+        # Accumulate with the batch size last, matching the column
+        # layout, so that each addition runs over contiguous samples
+        padded_imgs = np.zeros((channels, padded_h, padded_w, batch_size),
+                               dtype=cols.dtype)
+        cols_reshaped = cols.reshape(channels, fltr_height, fltr_width,
+                                     out_height, out_width, batch_size)
+
+        # Add column content to images at each filter offset
+        for i in range(fltr_height):
+            i_end = i + stride * (out_height - 1) + 1
+            for j in range(fltr_width):
+                j_end = j + stride * (out_width - 1) + 1
+                padded_imgs[:, i:i_end:stride, j:j_end:stride] += \
+                    cols_reshaped[:, i, j]
+
+        # Image without padding, with the batch size brought first
+        padded_imgs = padded_imgs.transpose(3, 0, 1, 2)
         return padded_imgs[:, :, pad_h[0]:height +
                            pad_h[0], pad_w[0]:width + pad_w[0]]
 
@@ -118,33 +227,84 @@ class Layer:
 
         return cols_reshaped
 
+    @classmethod
+    def get_image_windows(cls, images, fltr_shape, stride,
+                          output_shape=True):
+        """
+            Gives a read-only sliding-window view of the padded images
+            with shape (batch_size, channels, filter_height, filter_width,
+            output_height, output_width).
+            No patch is copied; each window shares memory with the
+            padded images.
+        """
+        padding = cls.get_padding(fltr_shape, output_shape)
+
+        return image_windows(pad_images(images, padding), fltr_shape, stride)
+
     @classmethod
     def get_img_cols_indices(cls, img_shape, fltr_shape, padding, stride=1):
         """
             Calculates indices for dot product between weights
-            and images
+            and images.
+            The indices do not depend on the batch size, so they
+            are looked up from a bounded LRU cache keyed by the
+            geometry of a single image.
         """
-
-        # Find expected output size
-        batch_size, channels, height, width = img_shape
-        fltr_height, fltr_width = fltr_shape
+        _, channels, height, width = img_shape
         pad_h, pad_w = padding
-        out_height = int((height + np.sum(pad_h) - fltr_height) / stride + 1)
-        out_width = int((width + np.sum(pad_w) - fltr_width) / stride + 1)
 
-        ind_i0 = np.repeat(np.arange(fltr_height), fltr_width)
-        ind_i0 = np.tile(ind_i0, channels)
-        ind_i1 = stride * np.repeat(np.arange(out_height), out_width)
+        return _img_cols_indices(int(channels), int(height), int(width),
+                                 tuple(int(dim) for dim in fltr_shape),
+                                 (tuple(int(pad) for pad in pad_h),
+                                  tuple(int(pad) for pad in pad_w)),
+                                 int(stride))
+
+    @classmethod
+    def index_cache_info(cls):
+        """
+            Gives the hits, misses and size of the im2col
+            index cache
+        """
+        return _img_cols_indices.cache_info()
+
+    @classmethod
+    def clear_index_cache(cls):
+        """
+            Empties the im2col index cache and resets its counters
+        """
+        _img_cols_indices.cache_clear()
+
+
+@functools.lru_cache(maxsize=INDEX_CACHE_SIZE)
+def _img_cols_indices(channels, height, width, fltr_shape, padding, stride):
+    """
+        Builds the im2col gather indices for one image geometry.
+        The arrays are shared between callers and are therefore
+        made read-only.
+    """
+
+    # Find expected output size
+    fltr_height, fltr_width = fltr_shape
+    pad_h, pad_w = padding
+    out_height = int((height + np.sum(pad_h) - fltr_height) / stride + 1)
+    out_width = int((width + np.sum(pad_w) - fltr_width) / stride + 1)
+
+    ind_i0 = np.repeat(np.arange(fltr_height), fltr_width)
+    ind_i0 = np.tile(ind_i0, channels)
+    ind_i1 = stride * np.repeat(np.arange(out_height), out_width)
 
-        ind_j0 = np.tile(np.arange(fltr_width), fltr_height * channels)
-        ind_j1 = stride * np.tile(np.arange(out_width), out_height)
-        ind_i = ind_i0.reshape(-1, 1) + ind_i1.reshape(1, -1)
-        ind_j = ind_j0.reshape(-1, 1) + ind_j1.reshape(1, -1)
+    ind_j0 = np.tile(np.arange(fltr_width), fltr_height * channels)
+    ind_j1 = stride * np.tile(np.arange(out_width), out_height)
+    ind_i = ind_i0.reshape(-1, 1) + ind_i1.reshape(1, -1)
+    ind_j = ind_j0.reshape(-1, 1) + ind_j1.reshape(1, -1)
 
-        ind_k = np.repeat(np.arange(channels), fltr_height *
-                          fltr_width).reshape(-1, 1)
+    ind_k = np.repeat(np.arange(channels), fltr_height *
+                      fltr_width).reshape(-1, 1)
 
-        return ind_k, ind_i, ind_j
+    for indices in (ind_k, ind_i, ind_j):
+        indices.setflags(write=False)
+
+    return ind_k, ind_i, ind_j
 
 
 class ConvolutionTwoD(Layer):
@@ -168,17 +328,45 @@ class ConvolutionTwoD(Layer):
             False - output without padding
         stride: int
             Step size of the filters during convolution over the input
+        algorithm: str
+            Forward pass algorithm. One of 'matmul', a product of the
+            filters with the image patches, 'fft', 'winograd' (3x3
+            filters at stride 1) or 'auto', which times the supported
+            algorithms once per input shape and keeps the fastest
+        im2col: str
+            How the 'matmul' algorithm lays out the image patches.
+            Other algorithms ignore it
+            'gather' - Copies each image patch into a column matrix
+            'strided' - Convolves one filter offset at a time over
+                        sliding-window views of the input, so only
+                        one offset's patches are copied at once.
+                        Lower peak memory than 'gather', at some
+                        cost in time
 
     """
 
     def __init__(self, no_of_filters, filter_shape,
-                 input_shape=None, padding=True, stride=1, trainable=True):
+                 input_shape=None, padding=True, stride=1, trainable=True,
+                 im2col='gather', algorithm='matmul'):
+        if im2col not in ('gather', 'strided'):
+            raise ValueError(f'Unknown im2col backend: {im2col}')
+        if algorithm != 'auto' and not supports_algorithm(
+                algorithm, filter_shape, stride):
+            raise ValueError(
+                f'Convolution algorithm {algorithm} does not support '
+                f'{filter_shape} filters at stride {stride}')
         self.no_of_filters = no_of_filters
         self.filter_shape = filter_shape
         self.input_shape = input_shape
         self.padding = padding
         self.stride = stride
         self.trainable = trainable
+        self.im2col = im2col
+        self.algorithm = algorithm
+        self.X_col = None
+
+    params = ('weight_', 'weight_out')
+    state = ('input_layer', 'W_col', 'X_col')
 
     def init_weights(self, optimizer):
         """
@@ -195,35 +383,102 @@ class ConvolutionTwoD(Layer):
                                                channels,
                                                fltr_height,
                                                fltr_width)
-                                         )
-        self.weight_out = np.zeros((self.no_of_filters, 1))
+                                         ).astype(self.dtype)
+        self.weight_out = np.zeros((self.no_of_filters, 1), dtype=self.dtype)
+        self.set_optimizer(optimizer)
+
+    def set_optimizer(self, optimizer):
+        """
+            Gives each parameter its own copy of the optimizer
+        """
         self.optimized_w = copy.copy(optimizer)
         self.optimized_w_out = copy.copy(optimizer)
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'no_of_filters': self.no_of_filters,
+                'filter_shape': self.filter_shape,
+                'padding': self.padding,
+                'stride': self.stride,
+                'im2col': self.im2col,
+                'algorithm': self.algorithm}
+
     def forward_pass(self, X, training=True):
         """
             Propagates input data through the network to
             get an output prediction
         """
-        self.input_layer = X
         batch_size, channels, height, width = X.shape
 
-        # For dot product between input and weights,
-        # change image shape to column shape
-        self.X_col = self.reshape_image_to_col(
-            X, self.filter_shape,
-            stride=self.stride,
-            output_shape=self.padding)
-
         # Reshape weight shape to column
-        self.W_col = self.weight_.reshape((self.no_of_filters, -1))
-        output = self.W_col.dot(self.X_col) + self.weight_out
+        W_col = self.weight_.reshape((self.no_of_filters, -1))
+        X_col = None
+
+        algorithm = self.algorithm
+        padding = self.get_padding(self.filter_shape, self.padding)
+
+        if algorithm == 'auto':
+            # Time the im2col backend this layer runs for 'matmul'
+            overrides = {'matmul': self.gather_convolve} \
+                if self.im2col == 'gather' else None
+            algorithm = autotune_algorithm(
+                X, self.weight_, self.stride, padding, overrides)
+
+        if algorithm != 'matmul' or self.im2col == 'strided':
+            # The weight gradient is found from a view of the
+            # input windows in the backward pass
+            output = convolution_algorithms[algorithm](
+                X, self.weight_, self.stride, padding)
+            output = output + self.weight_out.reshape((1, -1, 1, 1))
+        else:
+            # For dot product between input and weights,
+            # change image shape to column shape
+            X_col = self.reshape_image_to_col(
+                X, self.filter_shape,
+                stride=self.stride,
+                output_shape=self.padding)
+
+            output = W_col.dot(X_col) + self.weight_out
 
-        # Reshape output to: no_of_filters, height, width, and batch size
-        output = output.reshape(self.output_shape() + (batch_size, ))
+            # Reshape output to: no_of_filters, height, width, and
+            # batch size
+            output = output.reshape(self.output_shape() + (batch_size, ))
 
-        # Redistribute axes to bring batch size first
-        return output.transpose(3, 0, 1, 2)
+            # Redistribute axes to bring batch size first
+            output = output.transpose(3, 0, 1, 2)
+
+        # State for the backward pass is only written, never read,
+        # here, so concurrent inference passes do not interfere.
+        # Inference keeps nothing alive past the call
+        if training:
+            self.input_layer, self.W_col, self.X_col = X, W_col, X_col
+
+        return output
+
+    @property
+    def contiguous_output(self):
+        """
+            The products of the 'matmul' algorithm are laid out with
+            the batch size last and transposed, so the output is only
+            C-contiguous with 'fft' and 'winograd'. 'auto' may pick
+            either
+        """
+        return self.algorithm in ('fft', 'winograd')
+
+    def gather_convolve(self, X, weight, stride, padding):
+        """
+            Unbiased convolution through the gather im2col column
+            matrix, with the signature of the convolution algorithms
+        """
+        X_col = self.reshape_image_to_col(X, self.filter_shape,
+                                          stride=stride,
+                                          output_shape=self.padding)
+        output = weight.reshape((self.no_of_filters, -1)).dot(X_col)
+
+        return output.reshape(
+            self.output_shape() + (X.shape[0], )).transpose(3, 0, 1, 2)
 
     def backward_pass(self, grad):
         """
@@ -235,10 +490,18 @@ class ConvolutionTwoD(Layer):
                to all the weights in the network.
 
         """
+        if self.X_col is None:
+            return self.windowed_backward_pass(grad)
+
         # Reshape accumulated grad to column shape
         accumulated_grad = grad.transpose(
             1, 2, 3, 0).reshape(self.no_of_filters, -1)
 
+        # Find gradient to propagate back to previous layer
+        # -> Calculated on weights used on forward pass, before
+        #    an in-place update changes them
+        input_grad = self.W_col.T.dot(accumulated_grad)
+
         if self.trainable:
             # Find the dot product of the column-shaped accumulated grad
             # and column shape layer.
@@ -251,20 +514,40 @@ class ConvolutionTwoD(Layer):
             grad_w_out = np.sum(accumulated_grad, axis=1, keepdims=True)
 
             # Update layer weights
-            self.weight_ = self.optimized_w.update(self.weight_, grad_weight)
-            self.weight_out = self.optimized_w_out.update(
-                self.weight_out, grad_w_out)
+            self.update_params(grad_weight, grad_w_out)
 
-        # Find gradient to propagate back to previous layer
-        accumulated_grad = self.W_col.T.dot(accumulated_grad)
-
-        accumulated_grad = self.reshape_col_to_image(accumulated_grad,
+        accumulated_grad = self.reshape_col_to_image(input_grad,
                                                      self.input_layer.shape,
                                                      self.filter_shape,
                                                      stride=self.stride,
                                                      output_shape=self.padding)
         return accumulated_grad
 
+    def windowed_backward_pass(self, grad):
+        """
+            Backward pass without a column matrix, used when the
+            forward pass did not build one. Both gradients are found
+            one filter offset at a time over strided views of the
+            input
+        """
+        padding = self.get_padding(self.filter_shape, self.padding)
+
+        # Weights used on the forward pass, before an in-place
+        # update changes them
+        input_grad = convolution_input_gradient(
+            grad, self.W_col.reshape(self.weight_.shape),
+            self.input_layer.shape, self.stride, padding)
+
+        if self.trainable:
+            grad_weight = convolution_weight_gradient(
+                self.input_layer, grad, self.filter_shape, self.stride,
+                padding)
+            grad_w_out = np.sum(grad, axis=(0, 2, 3)).reshape((-1, 1))
+
+            self.update_params(grad_weight, grad_w_out)
+
+        return input_grad
+
     def output_shape(self):
         """
             Gives the shape of the output returned by the forward pass
@@ -285,6 +568,47 @@ class ConvolutionTwoD(Layer):
         return np.prod(self.weight_.shape) + \
             np.prod(self.weight_out.shape)
 
+    def param_optimizers(self):
+        """
+            Gives the weight and bias optimizers
+        """
+        return self.optimized_w, self.optimized_w_out
+
+    def activation_elements(self):
+        """
+            Gives the number of array elements per sample that the
+            forward pass creates, the column matrix the gather
+            'matmul' path keeps for the backward pass included.
+            'auto' may pick that path
+        """
+        out_elements = int(np.prod(self.output_shape()[1:]))
+        elements = self.no_of_filters * out_elements
+
+        if self.algorithm in ('matmul', 'auto') and self.im2col == 'gather':
+            elements += self.input_shape[0] * \
+                int(np.prod(self.filter_shape)) * out_elements
+
+        return elements
+
+    def estimate_flops(self):
+        """
+            Gives the forward and backward operation counts per sample.
+            The backward pass finds the input gradient, sums it back
+            into image shape and, when trainable, finds the weight
+            gradient
+        """
+        positions = int(np.prod(self.output_shape()[1:]))
+        patch = self.input_shape[0] * int(np.prod(self.filter_shape))
+        product = 2 * self.no_of_filters * patch * positions
+        bias = self.no_of_filters * positions
+
+        forward = product + bias
+        backward = product + patch * positions
+        if self.trainable:
+            backward += product + bias
+
+        return forward, backward
+
 
 class Activation(Layer):
     """
@@ -296,26 +620,68 @@ class Activation(Layer):
             Activation function to be used
     """
 
+    state = ('input_layer', 'output_layer')
+
     def __init__(self, name):
         self.activation_name = name
         self.activation_func = activation_functions.get(name)()
         self.trainable = True
+        self.input_layer = None
+        self.output_layer = None
+
+        # Gradient is found from the forward output when possible
+        self.grad_from_output = hasattr(self.activation_func,
+                                        'grad_from_output')
 
     def forward_pass(self, X, training=True):
         """
             Propagates input data through the network to
             get an output prediction
         """
-        self.input_layer = X
+        output = self.activation_func(
+            X, out=self.allocate('output', X.shape, X.dtype))
+
+        if not training:
+            return output
+
+        if self.grad_from_output:
+            self.output_layer = output
+        else:
+            self.input_layer = X
 
-        return self.activation_func(X)
+        return output
 
     def backward_pass(self, accumulated_grad):
         """
             Propagates backwards
         """
-        return accumulated_grad * \
-            self.activation_func.grad(self.input_layer)
+        grad = self.allocate('grad', accumulated_grad.shape,
+                             accumulated_grad.dtype)
+
+        if self.grad_from_output:
+            activation_grad = self.activation_func.grad_from_output(
+                self.output_layer)
+        else:
+            activation_grad = self.activation_func.grad(self.input_layer)
+
+        return np.multiply(accumulated_grad, activation_grad, out=grad)
+
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'name': self.activation_name}
+
+    def estimate_flops(self):
+        """
+            Gives the forward and backward operation counts per sample
+        """
+        elements = int(np.prod(self.input_shape))
+        flops = getattr(self.activation_func, 'flops', 1)
+
+        # The backward pass multiplies the activation gradient
+        # into the incoming gradient
+        return flops * elements, (flops + 1) * elements
 
     def output_shape(self):
         """
@@ -341,6 +707,8 @@ class DropOut(Layer):
             The probability that  the given unit is set to zero
     """
 
+    state = ('_mask',)
+
     def __init__(self, p=0.2):
         self.p = p
         self._mask = None
@@ -356,16 +724,40 @@ class DropOut(Layer):
        """
         c = (1 - self.p)
 
-        if training:
-            self._mask = np.random.uniform(size=X.shape) > self.p
-            c = self._mask
-        return X * c
+        if not training:
+            return X * c
+
+        random = np.random if self.random_state is None \
+            else self.random_state
+        self._mask = np.greater(random.uniform(size=X.shape), self.p,
+                                out=self.allocate('mask', X.shape, bool))
+
+        return np.multiply(X, self._mask,
+                           out=self.allocate('output', X.shape, X.dtype))
 
     def backward_pass(self, accumulated_grad):
         """
              Propagates the accumulated gradient backwards
         """
-        return accumulated_grad * self._mask
+        grad = self.allocate('grad', accumulated_grad.shape,
+                             accumulated_grad.dtype)
+
+        return np.multiply(accumulated_grad, self._mask, out=grad)
+
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'p': self.p}
+
+    def estimate_flops(self):
+        """
+            Gives the forward and backward operation counts per sample
+            in training, when the mask is drawn and applied
+        """
+        elements = int(np.prod(self.input_shape))
+
+        return 2 * elements, elements
 
     def output_shape(self):
         """
@@ -388,14 +780,28 @@ class BatchNormalization(Layer):
         self.running_var = None
         self.running_mean = None
 
+    params = ('gamma', 'beta')
+    state = ('X_centred', 'inv_std_dev')
+    buffers = ('running_mean', 'running_var')
+
     def init_weights(self, optimizer):
-        self.gamma = np.ones(self.input_shape)
-        self.beta = np.zeros(self.input_shape)
+        self.gamma = np.ones(self.input_shape, dtype=self.dtype)
+        self.beta = np.zeros(self.input_shape, dtype=self.dtype)
+        self.set_optimizer(optimizer)
 
-        # Parameter optimizers
+    def set_optimizer(self, optimizer):
+        """
+            Gives each parameter its own copy of the optimizer
+        """
         self.gamma_opt = copy.copy(optimizer)
         self.beta_opt = copy.copy(optimizer)
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'momentum': self.momentum}
+
     def paramitize(self):
         """
             Returns the number of trainable parameters used by the layer
@@ -403,6 +809,21 @@ class BatchNormalization(Layer):
         return np.product(self.gamma.shape) + \
             np.product(self.beta.shape)
 
+    def param_optimizers(self):
+        """
+            Gives the scale and shift optimizers
+        """
+        return self.gamma_opt, self.beta_opt
+
+    def estimate_flops(self):
+        """
+            Gives the forward and backward operation counts per sample
+            in training, batch statistics included
+        """
+        elements = int(np.prod(self.input_shape))
+
+        return 7 * elements, 11 * elements
+
     def output_shape(self):
         """
             Gives the shape of the output returned
@@ -430,43 +851,57 @@ class BatchNormalization(Layer):
             mean = self.running_mean
             var = self.running_var
 
-        # Stats saved for backward pass
-        self.X_centred = X - mean
-        self.inv_std_dev = 1 / np.sqrt(var + self.eps)
+        X_centred = np.subtract(
+            X, mean, out=self.allocate('X_centred', X.shape, X.dtype))
+        inv_std_dev = 1 / np.sqrt(var + self.eps)
 
-        X_normalized = self.X_centred * self.inv_std_dev
+        output = np.multiply(X_centred, inv_std_dev,
+                             out=self.allocate('output', X.shape, X.dtype))
+        output *= self.gamma
+        output += self.beta
+
+        # Stats saved for backward pass
+        if training:
+            self.X_centred, self.inv_std_dev = X_centred, inv_std_dev
 
-        return self.gamma * X_normalized + self.beta
+        return output
 
     def backward_pass(self, accumulated_grad):
         """
             Propagates the accumulated gradient backwards
        """
 
-        # Stat used during forward pass
-        gamma = self.gamma
-
-        if self.trainable:
-            X_normalized = self.X_centred * self.inv_std_dev
-            grad_gamma = np.sum(accumulated_grad * X_normalized, axis=0)
-            grad_beta = np.sum(accumulated_grad, axis=0)
-
-            self.gamma = self.gamma_opt.update(self.gamma, grad_gamma)
-            self.beta = self.beta_opt.update(self.beta, grad_beta)
-
+        shape, dtype = accumulated_grad.shape, accumulated_grad.dtype
+        scratch = self.allocate('scratch', shape, dtype)
+        grad_sum = np.sum(accumulated_grad, axis=0)
         batch_size = accumulated_grad.shape[0]
+        grad_dot_centred = np.sum(
+            np.multiply(accumulated_grad, self.X_centred, out=scratch),
+            axis=0)
 
         # loss gradient with respect to layer inputs
         # (Use stats from forward pass)
-        accumulated_grad = (1 / batch_size) * gamma * self.inv_std_dev * (
-            batch_size * accumulated_grad - np.sum(
-                accumulated_grad, axis=0) -
-            self.X_centred * self.inv_std_dev ** 2 *
-            np.sum(
-                accumulated_grad * self.X_centred, axis=0)
-        )
+        # (1 / N) * gamma * inv_std_dev * (N * grad - sum(grad)
+        #  - X_centred * inv_std_dev ** 2 * sum(grad * X_centred))
+        grad = np.multiply(accumulated_grad, batch_size,
+                           out=self.allocate('grad', shape, dtype))
+        grad -= grad_sum
+        grad -= np.multiply(self.X_centred,
+                            self.inv_std_dev ** 2 * grad_dot_centred,
+                            out=scratch)
+        grad *= (1 / batch_size) * self.gamma * self.inv_std_dev
+
+        # Parameters are updated once the input gradient no longer
+        # needs gamma
+        if self.trainable:
+            # accumulated_grad * X_normalized
+            np.multiply(self.X_centred, self.inv_std_dev, out=scratch)
+            scratch *= accumulated_grad
+            grad_gamma = np.sum(scratch, axis=0)
 
-        return accumulated_grad
+            self.update_params(grad_gamma, grad_sum)
+
+        return grad
 
 
 class Flatten(Layer):
@@ -486,6 +921,16 @@ class Flatten(Layer):
        """
         return (np.prod(self.input_shape),)
 
+    views_input = True
+
+    def activation_elements(self):
+        """
+            The output is a view of a contiguous input, so no
+            elements are created. The network counts the copy
+            made of other inputs
+        """
+        return 0
+
     def forward_pass(self, X, training=True):
         """
             Propagates forward
@@ -510,16 +955,31 @@ class Dense(Layer):
     input_shape: tuple
         Expected input shape of the layer. Needs to be specified for the first
         network layer
+
+    lazy_updates: bool
+        Updates only the weight rows of the features present in a
+        sparse batch, with an optimizer that has update_rows. The
+        moments of the other rows are then left as they are, so
+        training differs from the same batch passed dense
+
+    As the first layer it also takes scipy.sparse CSR batches. Only the
+    weight rows of the features present in a batch get gradients.
+    Without lazy_updates every weight still takes the step it would
+    take for the dense batch
     """
 
-    def __init__(self, units, input_shape=None):
+    def __init__(self, units, input_shape=None, lazy_updates=False):
         self.input_layer = None
         self.input_shape = input_shape
         self.units = units
+        self.lazy_updates = lazy_updates
         self.trainable = True
         self.weight = 0
         self.weight_out = 0
 
+    params = ('weight', 'weight_out')
+    state = ('input_layer',)
+
     def init_weights(self, optimizer):
         """
             Initializes the input weights
@@ -528,24 +988,67 @@ class Dense(Layer):
         self.weight = np.random.uniform(-limit,
                                         limit,
                                         (self.input_shape[0],
-                                            self.units))
-        self.weight_out = np.zeros((1, self.units))
-        # Weight optimizers
+                                            self.units)).astype(self.dtype)
+        self.weight_out = np.zeros((1, self.units), dtype=self.dtype)
+        self.set_optimizer(optimizer)
+
+    def set_optimizer(self, optimizer):
+        """
+            Gives each parameter its own copy of the optimizer
+        """
         self.optimized_w = copy.copy(optimizer)
         self.optimized_w_out = copy.copy(optimizer)
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'units': self.units,
+                'lazy_updates': self.lazy_updates}
+
     def paramitize(self):
         """
             Returns the number of trainable parameters used by the layer
         """
         return np.prod(self.weight.shape) + np.prod(self.weight_out.shape)
 
+    def param_optimizers(self):
+        """
+            Gives the weight and bias optimizers
+        """
+        return self.optimized_w, self.optimized_w_out
+
     def forward_pass(self, X, training=True):
         """
             Gets dot product of input shape and output weights
         """
-        self.input_layer = X
-        return X.dot(self.weight) + self.weight_out
+        if training:
+            self.input_layer = X
+        if sparse.issparse(X):
+            output = X.dot(self.weight)
+            output += self.weight_out
+            return output
+
+        output = self.allocate('output', (X.shape[0], self.units),
+                               np.result_type(X, self.weight))
+        np.dot(X, self.weight, out=output)
+        output += self.weight_out
+
+        return output
+
+    def estimate_flops(self):
+        """
+            Gives the forward and backward operation counts per sample.
+            The weight gradient is only found when trainable
+        """
+        product = 2 * self.input_shape[0] * self.units
+
+        forward = product + self.units
+        backward = product
+        if self.trainable:
+            backward += product + self.units
+
+        return forward, backward
 
     def output_shape(self):
         """
@@ -558,19 +1061,53 @@ class Dense(Layer):
         """
             Propagates backward
         """
-        weight_ = self.weight
+        if sparse.issparse(self.input_layer):
+            return self.sparse_backward_pass(accumulated_grad)
+
+        # Accumulated gradient for next layer
+        # -> Calculated on weights used on forward pass, before
+        #    an in-place update changes them
+        grad = self.allocate('grad',
+                             (accumulated_grad.shape[0], self.weight.shape[0]),
+                             np.result_type(accumulated_grad, self.weight))
+        np.dot(accumulated_grad, self.weight.T, out=grad)
 
         if self.trainable:
             weight_grad = self.input_layer.T.dot(accumulated_grad)
             weight_out_grad = np.sum(accumulated_grad, axis=0, keepdims=True)
 
-            self.weight = self.optimized_w.update(self.weight, weight_grad)
+            self.update_params(weight_grad, weight_out_grad)
+
+        return grad
+
+    def sparse_backward_pass(self, accumulated_grad):
+        """
+            Finds the weight gradient of the features present in a
+            sparse input batch. Sparse inputs are data, never the
+            output of another layer, so no input gradient is found
+        """
+        if not self.trainable:
+            return None
+
+        rows, rows_grad = nonzero_rows_product(self.input_layer,
+                                               accumulated_grad)
+        weight_out_grad = np.sum(accumulated_grad, axis=0, keepdims=True)
+
+        if self.lazy_updates and self.grad_views is None and \
+                hasattr(self.optimized_w, 'update_rows'):
+            self.weight = self.optimized_w.update_rows(
+                self.weight, rows, rows_grad)
             self.weight_out = self.optimized_w_out.update(
                 self.weight_out, weight_out_grad)
+            return None
 
-        # Accumulated gradient for next layer
-        # -> Calculated on weights used on forward pass
-        return accumulated_grad.dot(weight_.T)
+        # The flat buffer and other optimizers take the whole gradient,
+        # as does the dense-equivalent update
+        weight_grad = np.zeros_like(self.weight)
+        weight_grad[rows] = rows_grad
+        self.update_params(weight_grad, weight_out_grad)
+
+        return None
 
 
 class ConstantPadding2D(Layer):
@@ -633,6 +1170,13 @@ class ConstantPadding2D(Layer):
 
         return accumulated_grad
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'padding': self.padding,
+                'pad_value': self.pad_value}
+
     def output_shape(self):
         """
             Gives the output shape of the repeated input
@@ -703,6 +1247,12 @@ class UpSampling2D(Layer):
 
         return accumulated_grad[:, :, :: self.size[0], ::self.size[1]]
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'size': self.size}
+
     def output_shape(self):
         """
             Gives the output shape of the repeated input
@@ -729,6 +1279,16 @@ class Reshape(Layer):
         self.shape = shape
         self.input_shape = input_shape
 
+    views_input = True
+
+    def activation_elements(self):
+        """
+            The output is a view of a contiguous input, so no
+            elements are created. The network counts the copy
+            made of other inputs
+        """
+        return 0
+
     def forward_pass(self, X, training=True):
         """
             Reshapes input
@@ -742,6 +1302,12 @@ class Reshape(Layer):
         """
         return accumulated_grad.reshape(self.previous_shape)
 
+    def get_config(self):
+        """
+            Gives the constructor arguments that rebuild the layer
+        """
+        return {'shape': self.shape}
+
     def output_shape(self):
         """
             Returns dimensions of shape used in reshaping of
@@ -7,6 +7,17 @@ import numpy as np
 from ..utils.operations import op
 
 
+def clip_probability(y_prediction):
+    """
+        Clips probabilities away from 0 and 1.
+        The margin is widened to the machine epsilon of the
+        prediction's type so that 1 - margin stays below 1
+    """
+    eps = max(1e-15, np.finfo(y_prediction.dtype).eps)
+
+    return np.clip(y_prediction, eps, 1 - eps)
+
+
 class CrossEntropyLoss:
     """
         Perform operations that aid in computing the
@@ -18,7 +29,7 @@ class CrossEntropyLoss:
             Computes the cross entropy loss between the true
             and predicted values
         """
-        pred = np.clip(y_prediction, 1e-15, 1 - 1e-15)
+        pred = clip_probability(y_prediction)
 
         return -y_true * np.log(pred) - (1 - y_true) * np.log(1 - pred)
 
@@ -35,9 +46,37 @@ class CrossEntropyLoss:
         """
             Finds the gradient between p, and q values H(p, q)
         """
-        y_clipped = np.clip(y_pred, 1e-15, 1 - 1e-15)
+        y_clipped = clip_probability(y_pred)
         return - (y_true / y_clipped) + (1 - y_true) / (1 - y_clipped)
 
+    def compute_loss_from_logits(self, y_true, logits):
+        """
+            Computes the cross entropy loss of the softmax of the logits.
+            The log probabilities come from a log-sum-exp, so large
+            logits neither overflow nor lose the small probabilities.
+            Returns the loss and the softmax probabilities
+        """
+        log_prob = logits - np.max(logits, axis=-1, keepdims=True)
+        prob = np.exp(log_prob)
+        exp_sum = np.sum(prob, axis=-1, keepdims=True)
+        prob /= exp_sum
+        log_prob -= np.log(exp_sum)
+
+        # Same bounds as the clipped probabilities
+        eps = max(1e-15, np.finfo(prob.dtype).eps)
+        log_prob = np.clip(log_prob, np.log(eps), np.log1p(-eps))
+        log_complement = np.log1p(-np.clip(prob, eps, 1 - eps))
+
+        return -y_true * log_prob - (1 - y_true) * log_complement, prob
+
+    def find_logits_gradient(self, y_true, prob):
+        """
+            Finds the gradient with respect to the softmax inputs.
+            The loss gradient times the softmax gradient,
+            (p - y) / (p (1 - p)) * p (1 - p), reduces to p - y
+        """
+        return prob - y_true
+
 
 class MSE:
     """
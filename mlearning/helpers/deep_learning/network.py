@@ -1,6 +1,9 @@
 """
     This module contains a class that modles the Deep Learning Neural Network
 """
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy
 import progressbar
 
@@ -8,6 +11,18 @@ from terminaltables import AsciiTable
 
 from ..utils.display import progress_bar_widgets
 from ..utils.data_utils import Data
+from .workspace import Workspace
+from .parameters import FlatParameters
+from .inference import InferencePlan
+from .serialization import save_network, load_network
+from .profiling import LayerProfiler
+from .parallel import DataParallelTrainer
+from .sparse_inputs import as_samples
+from .tuning import (DEFAULT_CANDIDATES, host_key, read_cache, write_cache,
+                     time_batch_sizes, show_report)
+from .layers import Activation
+from .activation_functions import SoftMax
+from .loss import CrossEntropyLoss
 
 
 data_helper = Data()
@@ -24,17 +39,53 @@ class Neural_Network:
                     Measures the performance of the model
         validation_data: tuple
                         Contains the validation data items and (X, y) labels
+        dtype: numpy dtype
+                Floating point type of the layer weights, optimizer
+                state and activations. float32 halves the memory
+                traffic of float64
+        workspace: bool
+                Reuses preallocated layer outputs and gradients
+                across training batches instead of allocating
+                them for every batch. It keeps every layer's buffers
+                alive, so it cannot be combined with gradient
+                checkpointing
+        threads: int
+                Splits each training batch into this many micro-batches
+                whose forward and backward passes run concurrently in a
+                thread pool, before a single optimizer step. Batch
+                normalization then normalizes each micro-batch with
+                its own statistics (ghost batches), so networks with
+                it train differently from threads=1. Each micro-batch
+                draws its dropout masks from a RandomState seeded from
+                the global numpy RNG, so seeded runs are reproducible
+                but draw different masks than threads=1. The first
+                threaded batch flattens the parameters into one buffer
+                (see flatten_parameters) if they are not already
     """
 
-    def __init__(self, optimizer, loss, validation_data=None):
+    def __init__(self, optimizer, loss, validation_data=None,
+                 dtype=numpy.float64, workspace=False, threads=1):
+        if threads < 1:
+            raise ValueError(f'Number of threads must be positive: {threads}')
         self.optimizer = optimizer
         self.loss_func = loss()
+        self.dtype = numpy.dtype(dtype)
+        self.workspace = Workspace() if workspace else None
+        self.flat_params = None
+        self.profiler = None
+        self.threads = threads
+        self.thread_pool = None
+        self.thread_grads = []
+        self.segment_starts = None
+        self.segment_records = None
+        self.batch_size = None
         self.input_layers = []
         self.progressbar = progressbar.ProgressBar(
             widgets=progress_bar_widgets)
         self.errs = {'training': [],
                      'validation': []
                      }
+        self.validation_set = None
         if validation_data:
             X, y = validation_data
             self.validation_set = {
@@ -68,110 +119,913 @@ class Neural_Network:
         if self.input_layers:
             new_layer.set_input_shape(
                 shape=self.input_layers[-1].output_shape())
+        new_layer.dtype = self.dtype
 
         # Layer contains weights that require initialization
         if hasattr(new_layer, 'init_weights'):
             new_layer.init_weights(optimizer=self.optimizer)
         self.input_layers.append(new_layer)
 
-    def test_on_batch(self, X, y):
+    def compile_for_inference(self):
+        """
+            Freezes the trained network into an InferencePlan with
+            folded, read-only weights and the same make_prediction
+            signature
+        """
+        return InferencePlan(self)
+
+    def save(self, path, optimizer_state=False):
+        """
+            Saves the layers and their weights into the directory
+            at path. The optimizer moments and timesteps are only
+            saved, separately, when optimizer_state is set
+        """
+        save_network(self, path, optimizer_state=optimizer_state)
+
+    @classmethod
+    def load(cls, path, optimizer, loss, mmap_mode='r',
+             optimizer_state=False, **options):
+        """
+            Loads a network saved with save.
+            With mmap_mode the weights are memory-mapped rather than
+            read. The default read-only map serves predictions and
+            plain training, whose updates bind new arrays and leave
+            the file as it is. Updates made in place, by an
+            Adam(inplace=True) optimizer or Dense lazy_updates, need
+            'c' or None
+        """
+        return load_network(cls, path, optimizer, loss, mmap_mode=mmap_mode,
+                            optimizer_state=optimizer_state, **options)
+
+    def flatten_parameters(self):
+        """
+            Packs the parameters of every layer into one contiguous
+            buffer that is updated by a single fused optimizer step
+            per batch.
+            Call once all layers have been added.
+        """
+        self.flat_params = FlatParameters(
+            self.input_layers, self.optimizer, self.dtype)
+
+    def test_on_batch(self, X, y, **chunking):
         """
             Evaluates the model over samples in a single batch.
+            Chunking options are passed on to make_prediction
         """
+        y = numpy.asarray(y, dtype=self.dtype)
 
-        y_prediction = self.run_forward_pass(X, training=False)
+        y_prediction = self.make_prediction(X, **chunking)
         loss = numpy.mean(self.loss_func.compute_loss(y, y_prediction))
         acc = self.loss_func.get_acc_score(y, y_prediction)
 
         return loss, acc
 
-    def make_prediction(self, X):
+    def make_prediction(self, X, batch_size=None, max_memory=None,
+                        n_threads=1):
         """
             Predicts values of X from the train model
+
+            Parameters
+            ----------
+            batch_size: int
+                Streams X through the network in chunks of this many
+                samples, bounding the size of the layer intermediates
+            max_memory: int
+                Bytes the layer intermediates of all concurrent chunks
+                may take. Sets the batch size when none is given
+            n_threads: int
+                Number of chunks run concurrently
         """
-        return self.run_forward_pass(X, training=False)
+        if batch_size is None and max_memory is not None:
+            batch_size = max(1, int(
+                max_memory // (self.activation_bytes_per_sample() *
+                               max(1, n_threads))))
+
+        if batch_size is None or batch_size >= X.shape[0]:
+            return self.run_forward_pass(X, training=False)
 
-    def run_forward_pass(self, X, training=True):
+        return data_helper.map_over_batch(
+            lambda X_batch: self.run_forward_pass(X_batch, training=False),
+            X, batch_size, n_threads=n_threads)
+
+    def activation_bytes_per_sample(self):
         """
-            Calculates the output of the neural network
+            Estimates the bytes of layer intermediates that one sample
+            creates in a forward pass
         """
+        elements = sum(self.activation_elements())
+
+        return elements * self.dtype.itemsize
+
+    def activation_elements(self):
+        """
+            Gives the number of array elements per sample that the
+            forward pass of each layer creates. A layer that views
+            its input copies it instead when the layer before gives
+            a non-contiguous output
+        """
+        elements = []
+        contiguous = True
 
-        output_layer = X
         for layer in self.input_layers:
+            if layer.views_input and not contiguous:
+                elements.append(int(numpy.prod(layer.output_shape())))
+            else:
+                elements.append(layer.activation_elements())
+            contiguous = layer.contiguous_output
+
+        return elements
+
+    def run_forward_pass(self, X, training=True, layers=None):
+        """
+            Calculates the output of the neural network
+            (or of the given leading layers)
+        """
+        if layers is None:
+            layers = self.input_layers
+
+        output_layer = as_samples(X, self.dtype)
+
+        if training and self.segment_starts is not None:
+            return self.run_segmented_forward_pass(output_layer, layers)
+
+        return self.forward_layers(output_layer, layers, training)
+
+    def forward_layers(self, output_layer, layers, training=True,
+                       recompute=False):
+        """
+            Runs the forward passes of the layers in order.
+            recompute marks a repeated pass to the profiler
+        """
+        if self.profiler is not None:
+            for layer in layers:
+                output_layer = self.profiler.forward_pass(
+                    layer, output_layer, training, recompute)
+            return output_layer
+
+        for layer in layers:
             output_layer = layer.forward_pass(output_layer, training)
 
         return output_layer
 
-    def run_backward_pass(self, loss_gradient):
+    def run_backward_pass(self, loss_gradient, layers=None):
         """
             Propagates the gradient "backward" and updates weights
             in each layer from the loss gradient.
         """
+        if layers is None:
+            layers = self.input_layers
+
+        if self.segment_records is not None:
+            return self.run_segmented_backward_pass(loss_gradient, layers)
+
+        return self.backward_layers(loss_gradient, layers)
+
+    def backward_layers(self, loss_gradient, layers):
+        """
+            Runs the backward passes of the layers in reverse order
+        """
+        if self.profiler is not None:
+            for layer in reversed(layers):
+                loss_gradient = self.profiler.backward_pass(
+                    layer, loss_gradient)
+            return loss_gradient
 
-        for layer in reversed(self.input_layers):
+        for layer in reversed(layers):
             loss_gradient = layer.backward_pass(loss_gradient)
 
+        return loss_gradient
+
+    def enable_gradient_checkpointing(self, segments=None):
+        """
+            Splits the layers into segments whose intermediates are
+            dropped after the training forward pass and recomputed,
+            one segment at a time, in the backward pass. Only the
+            segment inputs stay alive in between, trading a second
+            forward pass for memory.
+
+            segments is the number of segments of equal length, by
+            default the square root of the number of layers, or the
+            indices of the layers that start a segment.
+            Networks with a workspace keep every intermediate in its
+            buffers, which would hide the saving, so they are refused
+        """
+        if self.threads > 1:
+            raise ValueError('Gradient checkpointing replays the global '
+                             'random state and cannot run with threads')
+        if self.workspace is not None:
+            raise ValueError('Gradient checkpointing drops intermediates '
+                             'the workspace would keep, and cannot run '
+                             'with a workspace')
+        no_of_layers = len(self.input_layers)
+
+        if segments is None:
+            segments = max(1, int(round(numpy.sqrt(no_of_layers))))
+        if isinstance(segments, int):
+            if segments < 1:
+                raise ValueError(f'Number of segments must be positive: '
+                                 f'{segments}')
+            starts = numpy.linspace(0, no_of_layers, segments + 1)[:-1]
+        else:
+            starts = [0] + list(segments)
+            if any(not 0 <= start < no_of_layers for start in starts):
+                raise ValueError(f'Segment starts must index layers: '
+                                 f'{segments}')
+
+        self.segment_starts = sorted({int(start) for start in starts})
+
+    def disable_gradient_checkpointing(self):
+        """
+            Keeps every layer's intermediates through the forward pass
+            again
+        """
+        self.segment_starts = None
+        self.segment_records = None
+
+    def segments(self, layers):
+        """
+            Gives the (start, stop) layer ranges of the checkpointed
+            segments of the given layers
+        """
+        starts = [start for start in self.segment_starts
+                  if start < len(layers)]
+
+        return list(zip(starts, starts[1:] + [len(layers)]))
+
+    def run_segmented_forward_pass(self, output_layer, layers):
+        """
+            Runs the training forward pass segment by segment, keeping
+            what is needed to recompute each segment: its input, the
+            random state its dropout masks are drawn from, and the
+            batch normalization running statistics it starts from
+        """
+        segments = self.segments(layers)
+        self.segment_records = []
+
+        for index, (start, stop) in enumerate(segments):
+            segment = layers[start:stop]
+            self.segment_records.append({
+                'input': output_layer,
+                'random_state': numpy.random.get_state(),
+                'buffers': [(layer, name, getattr(layer, name))
+                            for layer in segment for name in layer.buffers]
+            })
+            output_layer = self.forward_layers(output_layer, segment)
+
+            # The last segment is differentiated straight away
+            if index < len(segments) - 1:
+                for layer in segment:
+                    layer.release_state()
+
+        return output_layer
+
+    def recompute_segment(self, segment, record):
+        """
+            Repeats a segment's training forward pass exactly as it
+            first ran, leaving the random state and the running
+            statistics as they are now
+        """
+        random_state = numpy.random.get_state()
+        buffers = [(layer, name, getattr(layer, name))
+                   for layer in segment for name in layer.buffers]
+
+        numpy.random.set_state(record['random_state'])
+        for layer, name, value in record['buffers']:
+            setattr(layer, name, value)
+
+        self.forward_layers(record['input'], segment, recompute=True)
+
+        numpy.random.set_state(random_state)
+        for layer, name, value in buffers:
+            setattr(layer, name, value)
+
+    def run_segmented_backward_pass(self, loss_gradient, layers):
+        """
+            Differentiates the segments from the last one back,
+            recomputing each segment's intermediates first and
+            dropping them once its gradients are found
+        """
+        segments = self.segments(layers)
+        records, self.segment_records = self.segment_records, None
+
+        for index in reversed(range(len(segments))):
+            start, stop = segments[index]
+            segment = layers[start:stop]
+            if index < len(segments) - 1:
+                self.recompute_segment(segment, records[index])
+
+            loss_gradient = self.backward_layers(loss_gradient, segment)
+            for layer in segment:
+                layer.release_state()
+
+        return loss_gradient
+
+    def has_fused_head(self):
+        """
+            Checks whether the network ends in a softmax activation
+            trained on the cross entropy loss.
+            The two then collapse into a single (p - y) gradient
+            of the softmax inputs.
+        """
+        if not self.input_layers:
+            return False
+        head = self.input_layers[-1]
+
+        return isinstance(self.loss_func, CrossEntropyLoss) and \
+            isinstance(head, Activation) and \
+            isinstance(head.activation_func, SoftMax)
+
     def train_on_batch(self, X, y):
         """
             Updates the gradient over one batch of samples
         """
-        y_prediction = self.run_forward_pass(X)
-        loss = numpy.mean(self.loss_func.compute_loss(y, y_prediction))
+        loss, acc = self.compute_gradients(X, y)
+        self.apply_gradients()
 
-        acc = self.loss_func.get_acc_score(y, y_prediction)
+        return loss, acc
+
+    def compute_gradients(self, X, y):
+        """
+            Runs the forward and backward passes over one batch.
+            With flat parameters the gradients, summed over the
+            samples, are only collected into the flat gradient buffer
+            for apply_gradients. Otherwise each layer applies its own
+            update as the gradient reaches it
+        """
+        if self.threads > 1 and X.shape[0] > 1:
+            return self.compute_micro_batch_gradients(X, y)
+
+        if self.workspace is not None:
+            # Layers may be shared with other networks, so they are
+            # pointed at this network's workspace for each batch
+            for layer in self.input_layers:
+                layer.workspace = self.workspace
+            self.workspace.active = True
+        if self.flat_params is not None:
+            self.flat_params.attach()
+
+        try:
+            loss, acc = self.run_batch(X, y)
+        finally:
+            if self.workspace is not None:
+                self.workspace.active = False
+            if self.flat_params is not None:
+                self.flat_params.detach()
+
+        return loss, acc
+
+    def run_batch(self, X, y, layers=None):
+        """
+            Runs the forward and backward passes of the network
+            (or of the given layer replicas) over one batch
+        """
+        if layers is None:
+            layers = self.input_layers
+        y = numpy.asarray(y, dtype=self.dtype)
+
+        if self.has_fused_head():
+            # Skip the softmax layer and differentiate the loss
+            # with respect to its inputs
+            layers = layers[:-1]
+            logits = self.run_forward_pass(X, layers=layers)
+            loss, y_prediction = \
+                self.loss_func.compute_loss_from_logits(y, logits)
+            loss_gradient = self.loss_func.find_logits_gradient(
+                y, y_prediction)
+        else:
+            y_prediction = self.run_forward_pass(X, layers=layers)
+            loss = self.loss_func.compute_loss(y, y_prediction)
+
+            # Gradient of loss func with respect to predicted values
+            loss_gradient = self.loss_func.find_gradient(y, y_prediction)
 
-        # Gradient of loss func with respect to predicted values for y
-        loss_gradient = self.loss_func.find_gradient(y, y_prediction)
+        loss = numpy.mean(loss)
+        acc = self.loss_func.get_acc_score(y, y_prediction)
 
         # Update the weights
-        self.run_backward_pass(loss_gradient)
+        self.run_backward_pass(loss_gradient, layers)
 
         return loss, acc
 
-    def fit(self, X, y, no_of_epochs, batch_size):
+    def replicate_layers(self, grads, seed):
+        """
+            Gives shallow copies of the layers that share their
+            parameters but keep their own activations, and write
+            their gradients into the given flat gradient buffer.
+            The replicas draw from a RandomState of the given seed
+        """
+        random_state = numpy.random.RandomState(seed)
+        grad_views = self.flat_params.gradient_views(grads)
+        replicas = []
+
+        for layer in self.input_layers:
+            replica = copy.copy(layer)
+            replica.replica_of = layer
+            replica.grad_views = grad_views.get(layer)
+            # The global RNG is shared by the threads, so draws from
+            # it would depend on their scheduling
+            replica.random_state = random_state
+            # Workspace buffers are keyed by layer, and replicas
+            # only live for one batch
+            replica.workspace = None
+            replicas.append(replica)
+
+        return replicas
+
+    def compute_micro_batch_gradients(self, X, y):
+        """
+            Computes the gradients of one batch as contiguous
+            micro-batches trained concurrently by the thread pool.
+            numpy releases the GIL inside its kernels, so the
+            micro-batches overlap where a single BLAS call over a
+            mid-sized layer would not use every core.
+
+            Each thread runs layer replicas that hold its activations
+            and write its gradients into a buffer of its own. The
+            buffers are summed into the flat gradient buffer, and
+            the batch normalization running statistics of the
+            replicas are averaged back into the layers.
+
+            Batch normalization statistics are found per micro-batch,
+            as in DataParallelTrainer, so with it the gradients differ
+            from those of the whole batch. Without it they match.
+        """
+        if self.flat_params is None:
+            # The threads sum their gradients in the flat layout
+            self.flatten_parameters()
+        flat_params = self.flat_params
+        flat_params.repack()
+
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(self.threads)
+        while len(self.thread_grads) < self.threads - 1:
+            self.thread_grads.append(numpy.zeros_like(flat_params.grads))
+
+        batch_size = X.shape[0]
+        threads = min(self.threads, batch_size)
+        bounds = numpy.linspace(0, batch_size, threads + 1).astype(int)
+        grads = [flat_params.grads] + self.thread_grads[:threads - 1]
+        seeds = numpy.random.randint(2 ** 31, size=threads)
+
+        def run(rank):
+            replicas = self.replicate_layers(grads[rank], seeds[rank])
+            start, stop = bounds[rank], bounds[rank + 1]
+            loss, acc = self.run_batch(X[start:stop], y[start:stop],
+                                       replicas)
+            return loss, acc, replicas
+
+        results = list(self.thread_pool.map(run, range(threads)))
+
+        for thread_grads in grads[1:]:
+            flat_params.grads += thread_grads
+
+        weights = numpy.diff(bounds) / batch_size
+        for index, layer in enumerate(self.input_layers):
+            for name in layer.buffers:
+                if getattr(results[0][2][index], name, None) is not None:
+                    setattr(layer, name, sum(
+                        weight * getattr(result[2][index], name)
+                        for weight, result in zip(weights, results)))
+
+        loss = sum(weight * result[0]
+                   for weight, result in zip(weights, results))
+        acc = sum(weight * result[1]
+                  for weight, result in zip(weights, results))
+
+        return loss, acc
+
+    def apply_gradients(self):
+        """
+            Takes one optimizer step over the flat parameters from the
+            gradients collected by compute_gradients
+        """
+        if self.flat_params is not None:
+            self.flat_params.step()
+
+    def prepare_batch(self, batch):
+        """
+            Casts a batch of samples and labels to the network dtype.
+            Reads memory-mapped slices into memory. Sparse samples
+            stay sparse.
+        """
+        X_batch, y_batch = batch
+
+        return (as_samples(X_batch, self.dtype, contiguous=True),
+                numpy.asarray(y_batch, dtype=self.dtype))
+
+    def iterate_batches(self, X, y, batch_size, **sampling):
+        """
+            Gives the (X, y) batches of one epoch.
+            X is either an array of samples (possibly memory-mapped)
+            with labels y, or, when y is None, a source of (X, y)
+            batches: a callable returning a fresh batch iterator each
+            epoch, or an iterable. A one-shot iterator such as a
+            generator is used up by the first epoch, so fit takes it
+            for a single epoch only.
+            Sampling options are passed on to Data.iterate_over_batch
+        """
+        if y is not None:
+            return data_helper.iterate_over_batch(
+                X, y, batch_size=batch_size, **sampling)
+        if callable(X):
+            return iter(X())
+
+        return iter(X)
+
+    def tune_batch_size(self, X, y, candidates=DEFAULT_CANDIDATES, steps=5,
+                        max_memory=None, cache_path=None, show=True):
+        """
+            Finds the batch size that trains the most samples per
+            second on this host, by timing a few training steps of
+            each candidate that fits in max_memory bytes.
+            The network is left as it was. The best size is kept for
+            fit calls made without a batch size, and recorded in the
+            JSON file at cache_path, if given, to be reused on the
+            same host and model without new trials
+        """
+        key = host_key(self)
+        cache = read_cache(cache_path)
+        if key in cache:
+            self.batch_size = cache[key]
+            return self.batch_size
+
+        report = time_batch_sizes(self, X, y, candidates, steps, max_memory)
+        if not report:
+            raise ValueError('No candidate batch size fits the data '
+                             'and the memory limit')
+        if show:
+            show_report(report)
+
+        self.batch_size = max(
+            report, key=lambda trial: trial['samples_per_second'])[
+                'batch_size']
+        if cache_path is not None:
+            write_cache(cache_path, key, self.batch_size)
+
+        return self.batch_size
+
+    def validation_subset(self, validation_set, validation_samples, seed):
+        """
+            Gives a random subset of validation_samples samples of the
+            validation set, drawn from a RandomState of the given seed
+            so that the global RNG stream is left untouched
+        """
+        X_valid = as_samples(validation_set.get('X'), self.dtype)
+        if validation_samples >= X_valid.shape[0]:
+            return validation_set
+
+        idx = numpy.sort(numpy.random.RandomState(seed).choice(
+            X_valid.shape[0], validation_samples, replace=False))
+
+        return {'X': X_valid[idx],
+                'y': numpy.asarray(validation_set.get('y'))[idx]}
+
+    def fit(self, X, y, no_of_epochs, batch_size=None, prefetch=2,
+            shuffle=False, sort_batches=False, drop_last=False,
+            checkpoint=None, workers=1, validation_freq=1,
+            validation_samples=None, early_stopping=None):
         """
             Trains the model for a specified number of epochs
+
+            Parameters
+            ----------
+            X: array_like or iterable
+                Training samples, or a source of (X, y) batches
+                when y is None. A one-shot iterator, such as a
+                generator, can only train one epoch.
+                See iterate_batches
+            y: array_like
+                Training labels
+            batch_size: int
+                Number of samples per batch. Defaults to the size
+                found by tune_batch_size
+            prefetch: int
+                Number of batches a background thread prepares while
+                the current batch trains. 0 disables prefetching
+            shuffle, sort_batches, drop_last: bool
+                Batch sampling of array inputs.
+                See Data.iterate_over_batch
+            checkpoint: Checkpointer
+                Saves the training state every checkpoint.interval
+                epochs. Training resumes from the checkpoint when it
+                already holds one. Batch sources other than arrays
+                restart from their beginning
+            workers: int
+                Number of processes each batch is split across.
+                See DataParallelTrainer
+            validation_freq: int
+                Number of epochs between evaluations of the validation
+                set. The last epoch is always evaluated
+            validation_samples: int
+                Evaluates a random subset of this many validation
+                samples, drawn once per training run, instead of the
+                whole set. A checkpoint keeps the subset's seed, so a
+                resumed run validates on the same samples
+            early_stopping: EarlyStopping
+                Ends training when the validation loss stops
+                improving, putting back the best weights if it keeps
+                them. Its counters are saved with the checkpoint, and
+                a run resumed after it stopped trains no further
         """
+        if batch_size is None:
+            batch_size = self.batch_size
+        if batch_size is None:
+            raise ValueError('No batch size given or tuned')
+        if validation_freq < 1:
+            raise ValueError(f'Validation frequency must be positive: '
+                             f'{validation_freq}')
+        networks = {'network': self}
+        start_epoch = 0
+        progress = {}
+        if checkpoint is not None:
+            start_epoch, progress = checkpoint.restore(networks)
+        if y is None and not callable(X) and iter(X) is X and \
+                no_of_epochs - start_epoch > 1:
+            raise ValueError('A one-shot batch iterator is used up by the '
+                             'first epoch. Pass a callable returning a '
+                             'fresh iterator to train for several epochs')
+
+        validation_set = self.validation_set
+        validation_seed = None
+        if validation_set is not None and validation_samples is not None:
+            # A resumed run validates on the subset it started with
+            validation_seed = progress.get('validation_seed')
+            if validation_seed is None:
+                validation_seed = int(numpy.random.randint(2 ** 31))
+            validation_set = self.validation_subset(
+                validation_set, validation_samples, validation_seed)
+        if early_stopping is not None:
+            if validation_set is None:
+                raise ValueError('Early stopping needs validation data')
+            if 'early_stopping' in progress:
+                early_stopping.set_progress(progress['early_stopping'])
+                if early_stopping.stopped_epoch is not None:
+                    start_epoch = no_of_epochs
+            else:
+                early_stopping.reset()
 
-        for _ in self.progressbar(range(no_of_epochs)):
-            batch_err = []
-            for X_batch, y_batch in \
-                    data_helper.iterate_over_batch(
-                        X, y, batch_size=batch_size):
-                loss, _ = self.train_on_batch(X_batch, y_batch)
-                batch_err.append(loss)
+        train_on_batch = self.train_on_batch
+        trainer = None
+        if workers > 1:
+            trainer = DataParallelTrainer(self, workers, batch_size)
+            train_on_batch = trainer.train_on_batch
 
-            self.errs.get('training').append(numpy.mean(batch_err))
+        try:
+            for epoch in self.progressbar(range(start_epoch, no_of_epochs)):
+                batch_err = []
+                for X_batch, y_batch in data_helper.prefetch(
+                        self.iterate_batches(X, y, batch_size,
+                                             shuffle=shuffle,
+                                             sort_batches=sort_batches,
+                                             drop_last=drop_last),
+                        buffer_size=prefetch,
+                        prepare=self.prepare_batch):
+                    loss, _ = train_on_batch(X_batch, y_batch)
+                    batch_err.append(loss)
 
-            if self.validation_set is not None:
-                validation_loss, _ = self.test_on_batch(
-                    self.validation_set.get('X'),
-                    self.validation_set.get('y'))
-                self.errs['validation'].append(validation_loss)
+                self.errs.get('training').append(numpy.mean(batch_err))
+
+                stop = False
+                if validation_set is not None and (
+                        not (epoch + 1) % validation_freq or
+                        epoch + 1 == no_of_epochs):
+                    validation_loss, _ = self.test_on_batch(
+                        validation_set.get('X'), validation_set.get('y'))
+                    self.errs['validation'].append(validation_loss)
+
+                    if early_stopping is not None:
+                        stop = early_stopping.on_validation(
+                            self, epoch, validation_loss)
+
+                if checkpoint is not None:
+                    progress = {}
+                    if validation_seed is not None:
+                        progress['validation_seed'] = validation_seed
+                    if early_stopping is not None:
+                        progress['early_stopping'] = \
+                            early_stopping.get_progress()
+                    checkpoint.on_epoch_end(
+                        networks, epoch, epoch + 1 if stop else no_of_epochs,
+                        progress)
+                if stop:
+                    break
+        finally:
+            if trainer is not None:
+                trainer.close()
+
+        if checkpoint is not None:
+            checkpoint.wait()
+        if early_stopping is not None and \
+                early_stopping.restore_best_weights:
+            early_stopping.restore(self)
+
+        # The last batch's intermediates are never propagated back
+        self.release_state()
 
         return self.errs.values()
 
-    def show_model_details(self, name='Summary of Model'):
+    def enable_profiling(self):
+        """
+            Times every layer pass from now on.
+            Returns the LayerProfiler holding the records
+        """
+        self.profiler = LayerProfiler(self.input_layers)
+
+        return self.profiler
+
+    def disable_profiling(self):
+        """
+            Returns the passes to the untimed loop and gives the
+            profiler that was recording
+        """
+        profiler, self.profiler = self.profiler, None
+
+        return profiler
+
+    def release_state(self):
+        """
+            Drops the arrays every layer holds from the last training
+            forward pass. Inference passes retain nothing
+        """
+        for layer in self.input_layers:
+            layer.release_state()
+
+    def memory_report(self, show=True):
+        """
+            Gives the bytes each layer holds in parameters and in state
+            retained for the backward pass.
+            An array shared by layers, such as one layer's output kept
+            as the next layer's input, is counted once, against the
+            first layer holding it.
+        """
+        def owner(array):
+            while isinstance(array.base, numpy.ndarray):
+                array = array.base
+            return array
+
+        seen = set()
+        report = {}
+
+        for layer in self.input_layers:
+            for name in layer.params:
+                param = getattr(layer, name, None)
+                if isinstance(param, numpy.ndarray):
+                    seen.add(id(owner(param)))
+
+        for index, layer in enumerate(self.input_layers):
+            param_bytes = sum(
+                getattr(layer, name).nbytes for name in layer.params
+                if isinstance(getattr(layer, name, None), numpy.ndarray))
+            state_bytes = 0
+
+            for name, array in layer.retained_arrays():
+                base = owner(array)
+                if id(base) not in seen:
+                    seen.add(id(base))
+                    state_bytes += base.nbytes
+
+            report[f'{index} {layer}'] = {'parameters': param_bytes,
+                                          'state': state_bytes}
+
+        if show:
+            data = [['Layer', 'Parameter Bytes', 'Retained State Bytes']]
+            data += [[name, usage['parameters'], usage['state']]
+                     for name, usage in report.items()]
+            data.append([
+                'Total',
+                sum(usage['parameters'] for usage in report.values()),
+                sum(usage['state'] for usage in report.values())])
+            print(AsciiTable(data).table)
+
+        return report
+
+    def optimizer_state_bytes(self, layer):
+        """
+            Gives the bytes the optimizers of the layer's parameters
+            keep, e.g. the two moment estimates of Adam
+        """
+        return sum(getattr(optimizer, 'state_slots', 0) *
+                   numpy.size(getattr(layer, name)) * self.dtype.itemsize
+                   for name, optimizer in zip(layer.params,
+                                              layer.param_optimizers()))
+
+    def estimate_training_memory(self, batch_size):
+        """
+            Estimates the bytes a training step over a batch of the
+            given size holds at its peak: the parameters, their
+            gradients and optimizer state, every layer's forward
+            intermediates, and the backward pass working arrays of
+            the largest layer. With gradient checkpointing only the
+            segment boundaries and one recomputed segment count
+        """
+        itemsize = self.dtype.itemsize
+        parameters = sum(int(layer.paramitize())
+                         for layer in self.input_layers) * itemsize
+        optimizer_state = sum(self.optimizer_state_bytes(layer)
+                              for layer in self.input_layers)
+        activations = batch_size * self.activation_bytes_per_sample()
+        if self.segment_starts is not None:
+            report = self.gradient_checkpointing_report(batch_size,
+                                                        show=False)
+            # The kept segment boundaries, and one segment's
+            # intermediates recomputed at a time
+            activations = sum(segment['kept'] for segment in report) + \
+                max(segment['activations'] for segment in report)
+        backward = batch_size * itemsize * max(self.activation_elements(),
+                                               default=0)
+
+        memory = {'parameters': parameters,
+                  'gradients': parameters,
+                  'optimizer_state': optimizer_state,
+                  'activations': activations,
+                  'backward': backward}
+        memory['peak'] = sum(memory.values())
+
+        return memory
+
+    def gradient_checkpointing_report(self, batch_size, show=True):
+        """
+            Gives the activation bytes each checkpointed segment holds
+            between the forward and backward passes over a batch of
+            the given size, without and with checkpointing.
+            A segment keeps only its output for the next one, the
+            last segment keeps all of its intermediates.
+        """
+        if self.segment_starts is None:
+            raise ValueError('Gradient checkpointing is not enabled')
+        itemsize = self.dtype.itemsize
+        segments = self.segments(self.input_layers)
+        elements = self.activation_elements()
+        report = []
+
+        for index, (start, stop) in enumerate(segments):
+            segment = self.input_layers[start:stop]
+            activations = batch_size * itemsize * sum(elements[start:stop])
+            kept = activations
+            if index < len(segments) - 1:
+                kept = batch_size * itemsize * int(
+                    numpy.prod(segment[-1].output_shape()))
+            report.append({'segment': f'{start} - {stop - 1}',
+                           'activations': activations,
+                           'kept': kept,
+                           'saved': activations - kept})
+
+        if show:
+            data = [['Layers', 'Activations (MB)', 'Kept (MB)',
+                     'Saved (MB)']]
+            for segment in report:
+                data.append([segment['segment'],
+                             f"{segment['activations'] / 2 ** 20:.2f}",
+                             f"{segment['kept'] / 2 ** 20:.2f}",
+                             f"{segment['saved'] / 2 ** 20:.2f}"])
+            print(AsciiTable(data).table,
+                  f"\nTotal Saved "
+                  f"{sum(s['saved'] for s in report) / 2 ** 20:.2f} MB")
+
+        return report
+
+    def show_model_details(self, name='Summary of Model', batch_size=None):
         """
             Gives  a summary of the network model
             and configuration of the network layers.
+            FLOPs are rough per-sample counts. With a batch size the
+            estimated peak training memory is shown too.
         """
         # Model name
         print(AsciiTable([[name]]).table)
 
         # Network input's (First Layer) shape
         print(f"Input Shape: {self.input_layers[0].input_shape}")
-        data = [['Layer Type', 'Parameters', 'Output Shape']]
+        data = [['Layer Type', 'Parameters', 'Output Shape',
+                 'Forward FLOPs', 'Backward FLOPs', 'Activations (B)',
+                 'Optimizer State (B)']]
         layer_parameters = 0
 
-        for layer in self.input_layers:
+        for layer, elements in zip(self.input_layers,
+                                   self.activation_elements()):
             params = layer.paramitize()
+            forward_flops, backward_flops = layer.estimate_flops()
             data.append([
                 layer,
                 params,
-                layer.output_shape()
+                layer.output_shape(),
+                forward_flops,
+                backward_flops,
+                elements * self.dtype.itemsize,
+                self.optimizer_state_bytes(layer)
             ]
             )
             layer_parameters += params
         print(AsciiTable(data).table,
               f"\nTotal Parameters {layer_parameters}")
+
+        if batch_size is not None:
+            memory = self.estimate_training_memory(batch_size)
+            print(f"Peak Training Memory (batch size {batch_size}): "
+                  f"{memory['peak'] / 2 ** 20:.2f} MB "
+                  f"(parameters and gradients "
+                  f"{2 * memory['parameters'] / 2 ** 20:.2f} MB, "
+                  f"optimizer state "
+                  f"{memory['optimizer_state'] / 2 ** 20:.2f} MB, "
+                  f"activations {memory['activations'] / 2 ** 20:.2f} MB, "
+                  f"backward {memory['backward'] / 2 ** 20:.2f} MB)")
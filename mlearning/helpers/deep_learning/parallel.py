@@ -0,0 +1,245 @@
+"""
+    This module contains the data-parallel trainer that splits each
+    training batch across worker processes holding network replicas.
+"""
+import multiprocessing
+import os
+
+import numpy as np
+from scipy import sparse
+from threadpoolctl import threadpool_limits
+
+
+def shared_array(shape, dtype):
+    """
+        Gives a zeroed array in shared memory, which processes
+        forked afterwards see and write in place
+    """
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    buffer = multiprocessing.RawArray('b', max(1, size * dtype.itemsize))
+
+    return np.frombuffer(buffer, dtype=dtype, count=size).reshape(shape)
+
+
+class DataParallelTrainer:
+    """
+        Trains a network on each batch with several processes.
+
+        The weights and one gradient slot per process live in shared
+        memory. The calling process and workers - 1 forked processes
+        each hold a replica of the network that shares the weights.
+        Every batch is split into one contiguous slice per process,
+        and each process writes the summed gradients of its slice
+        into its own slot. The slots are then reduced into the
+        first one, and a single optimizer step updates the shared
+        weights that every replica reads.
+
+        Batch normalization statistics are found per slice, and the
+        running statistics of the replicas are averaged after every
+        step. Each worker draws dropout masks from its own seed.
+
+        Workers are started with fork, so the trainer runs on
+        platforms that provide it.
+
+        Each process computes its slice with BLAS calls that would
+        otherwise start a thread per core, so several processes
+        fight over the same cores and train slower than one. The
+        BLAS libraries are therefore limited to blas_threads threads
+        in every process while the trainer is open. Training then
+        scales when the host has at least as many cores as workers
+        and each slice is large enough that its products outweigh
+        the copy of the batch into shared memory and the gradient
+        reduction, e.g. a few hundred samples per worker through
+        layers of hundreds of units. With fewer cores than workers,
+        or small slices, one process with every BLAS thread is
+        faster.
+
+        Parameters
+        ----------
+        network: Neural_Network
+            Network to train. Its parameters are flattened if
+            they are not already
+        workers: int
+            Number of processes computing gradients, the calling
+            process included
+        batch_size: int
+            Largest batch that will be trained
+        blas_threads: int
+            Number of BLAS threads of each process. By default the
+            cores are split evenly between the processes
+    """
+
+    def __init__(self, network, workers, batch_size, blas_threads=None):
+        if workers < 1:
+            raise ValueError(f'Number of workers must be positive: {workers}')
+        if blas_threads is None:
+            blas_threads = max(1, (os.cpu_count() or 1) // workers)
+        self.network = network
+        self.workers = workers
+        self.batch_size = batch_size
+        self.blas_threads = blas_threads
+        self.running_stats = None
+        # Set before the fork, so the workers start limited too
+        self.blas_limits = threadpool_limits(limits=blas_threads,
+                                             user_api='blas')
+
+        if network.flat_params is None:
+            network.flatten_parameters()
+        flat_params = network.flat_params
+        dtype = network.dtype
+
+        size = flat_params.weights.size
+        self.grads = shared_array((workers, size), dtype)
+        flat_params.rebind(weights=shared_array(size, dtype),
+                           grads=self.grads[0])
+
+        self.X = shared_array(
+            (batch_size,) + tuple(network.input_layers[0].input_shape), dtype)
+        self.y = shared_array(
+            (batch_size,) + tuple(network.input_layers[-1].output_shape()),
+            dtype)
+
+        seeds = np.random.randint(2 ** 31, size=workers)
+        context = multiprocessing.get_context('fork')
+        self.connections = []
+        self.processes = []
+
+        for rank in range(1, workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=self.serve,
+                args=(rank, worker_connection, seeds[rank]),
+                daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def get_running_stats(self):
+        """
+            Gives the batch normalization running statistics of the
+            local replica, keyed by layer index and name
+        """
+        return {(index, name): getattr(layer, name)
+                for index, layer in enumerate(self.network.input_layers)
+                for name in layer.buffers
+                if getattr(layer, name, None) is not None}
+
+    def set_running_stats(self, running_stats):
+        """
+            Sets the batch normalization running statistics of the
+            local replica
+        """
+        for (index, name), value in running_stats.items():
+            setattr(self.network.input_layers[index], name, value)
+
+    def serve(self, rank, connection, seed):
+        """
+            Worker loop: computes the gradients of the requested batch
+            slice into the worker's gradient slot until told to stop
+        """
+        np.random.seed(seed)
+        # BLAS thread pools are not always carried over a fork
+        threadpool_limits(limits=self.blas_threads, user_api='blas')
+        self.network.flat_params.rebind(grads=self.grads[rank])
+        # Threads of a pool started before the fork do not exist here
+        self.network.thread_pool = None
+
+        while True:
+            task = connection.recv()
+            if task is None:
+                break
+            start, stop, running_stats = task
+
+            try:
+                if running_stats is not None:
+                    self.set_running_stats(running_stats)
+                loss, acc = self.network.compute_gradients(
+                    self.X[start:stop], self.y[start:stop])
+                connection.send((loss, acc, self.get_running_stats()))
+            except Exception as error:
+                connection.send(error)
+
+        connection.close()
+
+    def train_on_batch(self, X, y):
+        """
+            Updates the weights over one batch, split across the
+            worker processes
+        """
+        batch_size = X.shape[0]
+        if batch_size > self.batch_size:
+            raise ValueError(f'Batch of {batch_size} samples exceeds the '
+                             f'trainer batch size {self.batch_size}')
+        # The shared input buffer is dense
+        self.X[:batch_size] = X.toarray() if sparse.issparse(X) else X
+        self.y[:batch_size] = y
+
+        # Slices differ by at most one sample; only the last ones
+        # are empty when there are fewer samples than workers
+        sizes = np.full(self.workers, batch_size // self.workers)
+        sizes[:batch_size % self.workers] += 1
+        bounds = np.concatenate(([0], np.cumsum(sizes)))
+        busy = [rank for rank in range(1, self.workers) if sizes[rank]]
+
+        for rank in busy:
+            self.connections[rank - 1].send(
+                (bounds[rank], bounds[rank + 1], self.running_stats))
+
+        # The calling process trains the first slice meanwhile
+        loss, acc = self.network.compute_gradients(
+            self.X[:bounds[1]], self.y[:bounds[1]])
+        results = [(loss, acc, self.get_running_stats())]
+
+        errors = []
+        for rank in busy:
+            result = self.connections[rank - 1].recv()
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                results.append(result)
+        if errors:
+            raise errors[0]
+
+        # All-reduce: the summed gradient of the whole batch
+        for rank in busy:
+            self.grads[0] += self.grads[rank]
+        self.network.apply_gradients()
+
+        weights = sizes[[0] + busy] / batch_size
+        loss = sum(weight * result[0]
+                   for weight, result in zip(weights, results))
+        acc = sum(weight * result[1]
+                  for weight, result in zip(weights, results))
+
+        self.running_stats = {
+            key: sum(weight * result[2][key]
+                     for weight, result in zip(weights, results))
+            for key in results[0][2]}
+        self.set_running_stats(self.running_stats)
+
+        return loss, acc
+
+    def close(self):
+        """
+            Stops the workers, moves the weights back out of shared
+            memory and lifts the BLAS thread limit
+        """
+        for connection in self.connections:
+            connection.send(None)
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections, self.processes = [], []
+
+        flat_params = self.network.flat_params
+        flat_params.rebind(weights=np.array(flat_params.weights),
+                           grads=np.array(flat_params.grads))
+        self.blas_limits.restore_original_limits()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
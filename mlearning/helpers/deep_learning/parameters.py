@@ -0,0 +1,208 @@
+"""
+    This module contains the flat parameter buffer that lets a
+    network update all of its layer parameters in one optimizer step.
+"""
+import copy
+
+import numpy as np
+
+
+class FlatParameters:
+    """
+        Packs the trainable parameters of the layers into one
+        contiguous buffer.
+        Each layer parameter is rebound to a view of the buffer and
+        gets a matching view of a flat gradient buffer, so a single
+        fused optimizer step updates every tensor in place.
+        Moments and timesteps the parameter optimizers already hold,
+        e.g. from a loaded model, are packed with them.
+
+        Parameters
+        ----------
+        layers: list
+            Network layers whose parameters are packed
+        optimizer: object
+            Optimizer whose hyperparameters the fused step uses
+        dtype: numpy dtype
+            Type of the packed buffers
+    """
+
+    def __init__(self, layers, optimizer, dtype):
+        self.optimizer = copy.copy(optimizer)
+        self.entries = []
+        self.layer_slices = []
+        start = 0
+
+        for layer in layers:
+            layer_start = start
+            for name in layer.params:
+                shape = np.shape(getattr(layer, name))
+                size = int(np.prod(shape))
+                self.entries.append(
+                    (layer, name, slice(start, start + size), shape))
+                start += size
+            if start > layer_start:
+                self.layer_slices.append((layer, slice(layer_start, start)))
+
+        self.weights = np.empty(start, dtype=dtype)
+        self.grads = np.zeros(start, dtype=dtype)
+        self.mean = np.zeros(start, dtype=dtype)
+        self.uncentered_variance = np.zeros(start, dtype=dtype)
+        self.scratch = np.empty(start, dtype=dtype)
+        self.pack_state()
+
+        for layer, name, index, shape in self.entries:
+            self.weights[index] = np.ravel(getattr(layer, name))
+        self.bind_views()
+
+    def bind_views(self):
+        """
+            Points the layer parameters at views of the weights buffer
+            and builds their gradient buffer views
+        """
+        self.views = {}
+
+        for layer, name, index, shape in self.entries:
+            view = self.weights[index].reshape(shape)
+            setattr(layer, name, view)
+            self.views[layer, name] = view
+        self.grad_views = self.gradient_views(self.grads)
+
+    def gradient_views(self, grads):
+        """
+            Gives each layer's parameter gradient views of a flat
+            gradient buffer laid out like the weights
+        """
+        grad_views = {}
+
+        for layer, _, index, shape in self.entries:
+            grad_views.setdefault(layer, []).append(
+                grads[index].reshape(shape))
+
+        return grad_views
+
+    def rebind(self, weights=None, grads=None):
+        """
+            Moves the packed weights or gradients into other flat
+            arrays of the same size, e.g. shared memory, and points
+            the layers at views of them
+        """
+        self.repack()
+
+        if weights is not None:
+            weights[...] = self.weights
+            self.weights = weights
+        if grads is not None:
+            grads[...] = self.grads
+            self.grads = grads
+
+        self.bind_views()
+
+    def param_optimizers(self):
+        """
+            Gives the (optimizer, buffer range) of every packed
+            parameter
+        """
+        for layer, name, index, _ in self.entries:
+            optimizers = dict(zip(layer.params, layer.param_optimizers()))
+            yield optimizers[name], index
+
+    def pack_state(self):
+        """
+            Copies the moments and timesteps held by the parameter
+            optimizers into the flat buffers
+        """
+        # Updates made to each layer, for the bias correction
+        self.timesteps = [max((optimizer.timestep for optimizer in
+                               layer.param_optimizers()), default=0)
+                          for layer, _ in self.layer_slices]
+
+        for optimizer, index in self.param_optimizers():
+            if optimizer.mean is None:
+                self.mean[index] = 0
+                self.uncentered_variance[index] = 0
+            else:
+                self.mean[index] = optimizer.mean.ravel()
+                self.uncentered_variance[index] = \
+                    optimizer.uncentered_variance.ravel()
+
+    def unpack_state(self):
+        """
+            Copies the flat moments and timesteps back into the
+            parameter optimizers
+        """
+        timesteps = {layer: timestep for (layer, _), timestep in
+                     zip(self.layer_slices, self.timesteps)}
+
+        for (optimizer, index), (layer, _, _, shape) in zip(
+                self.param_optimizers(), self.entries):
+            optimizer.mean = self.mean[index].reshape(shape).copy()
+            optimizer.uncentered_variance = \
+                self.uncentered_variance[index].reshape(shape).copy()
+            optimizer.timestep = timesteps[layer]
+
+    def attach(self):
+        """
+            Points the layers' gradient updates at the flat
+            gradient buffer
+        """
+        for layer, views in self.grad_views.items():
+            layer.grad_views = views
+
+    def detach(self):
+        """
+            Restores the layers' own per-parameter updates
+        """
+        for layer in self.grad_views:
+            layer.grad_views = None
+
+    def repack(self):
+        """
+            Copies back parameters that were rebound to new arrays,
+            e.g. weights inherited by an evolved network
+        """
+        for (layer, name), view in self.views.items():
+            value = getattr(layer, name)
+            if value is not view:
+                view[...] = value
+                setattr(layer, name, view)
+
+    def trainable_slices(self):
+        """
+            Gives the buffer ranges and next timesteps of the trainable
+            layers. Adjacent layers at the same timestep are merged
+            into one range
+        """
+        slices = []
+
+        for (layer, index), timestep in zip(self.layer_slices,
+                                            self.timesteps):
+            if not layer.trainable:
+                continue
+            if slices and slices[-1][0].stop == index.start and \
+                    slices[-1][1] == timestep + 1:
+                slices[-1] = (slice(slices[-1][0].start, index.stop),
+                              timestep + 1)
+            else:
+                slices.append((index, timestep + 1))
+
+        return slices
+
+    def step(self):
+        """
+            Updates the parameters of all trainable layers from
+            the collected gradients
+        """
+        self.repack()
+
+        for index, timestep in self.trainable_slices():
+            self.optimizer.fused_step(self.weights[index],
+                                      self.grads[index],
+                                      self.mean[index],
+                                      self.uncentered_variance[index],
+                                      timestep,
+                                      self.scratch[index])
+
+        for i, (layer, _) in enumerate(self.layer_slices):
+            if layer.trainable:
+                self.timesteps[i] += 1
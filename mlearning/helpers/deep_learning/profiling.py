@@ -0,0 +1,174 @@
+"""
+    This module contains the per-layer profiler that a network runs
+    its forward and backward passes through when profiling is on.
+"""
+import json
+import threading
+import time
+
+from terminaltables import AsciiTable
+
+from .sparse_inputs import array_bytes
+
+
+class LayerProfiler:
+    """
+        Records the wall time, calls, input and output bytes and
+        estimated floating point operations of each layer pass.
+
+        Forward passes that gradient checkpointing repeats before a
+        segment's backward pass are recorded apart from the forward
+        totals, as recomputation. The totals are updated under a
+        lock, so per-thread replicas of a layer can record at once.
+
+        Parameters
+        ----------
+        layers: list
+            Layers of the profiled network, used to name and order
+            the report
+    """
+
+    def __init__(self, layers):
+        self.layers = list(layers)
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def layer_stats(self, layer):
+        """
+            Gives the running totals kept for the layer, or for the
+            layer it is a per-thread replica of.
+            Call with the lock held
+        """
+        layer = getattr(layer, 'replica_of', layer)
+        if layer not in self.stats:
+            self.stats[layer] = {
+                'forward_calls': 0, 'backward_calls': 0,
+                'recompute_calls': 0,
+                'forward_time': 0.0, 'backward_time': 0.0,
+                'recompute_time': 0.0,
+                'input_bytes': 0, 'output_bytes': 0,
+                'forward_flops': 0, 'backward_flops': 0,
+                'recompute_flops': 0}
+            if layer not in self.layers:
+                self.layers.append(layer)
+
+        return self.stats[layer]
+
+    def forward_pass(self, layer, X, training, recompute=False):
+        """
+            Runs and times the layer's forward pass.
+            A recomputed pass is recorded as recomputation
+        """
+        start = time.perf_counter()
+        output = layer.forward_pass(X, training)
+        elapsed = time.perf_counter() - start
+        flops = int(X.shape[0] * layer.estimate_flops()[0])
+
+        with self.lock:
+            stats = self.layer_stats(layer)
+            if recompute:
+                stats['recompute_calls'] += 1
+                stats['recompute_time'] += elapsed
+                stats['recompute_flops'] += flops
+            else:
+                stats['forward_calls'] += 1
+                stats['forward_time'] += elapsed
+                stats['input_bytes'] += array_bytes(X)
+                stats['output_bytes'] += array_bytes(output)
+                stats['forward_flops'] += flops
+
+        return output
+
+    def backward_pass(self, layer, accumulated_grad):
+        """
+            Runs and times the layer's backward pass
+        """
+        start = time.perf_counter()
+        grad = layer.backward_pass(accumulated_grad)
+        elapsed = time.perf_counter() - start
+        flops = int(accumulated_grad.shape[0] * layer.estimate_flops()[1])
+
+        with self.lock:
+            stats = self.layer_stats(layer)
+            stats['backward_calls'] += 1
+            stats['backward_time'] += elapsed
+            stats['backward_flops'] += flops
+
+        return grad
+
+    def reset(self):
+        """
+            Clears the recorded totals
+        """
+        with self.lock:
+            self.stats.clear()
+
+    def report(self):
+        """
+            Gives the recorded totals of each profiled layer,
+            in network order. The total time and FLOPs include
+            recomputation
+        """
+        report = []
+
+        with self.lock:
+            recorded = [(index, layer, dict(self.stats[layer]))
+                        for index, layer in enumerate(self.layers)
+                        if layer in self.stats]
+
+        for index, layer, stats in recorded:
+            total_time = stats['forward_time'] + stats['backward_time'] + \
+                stats['recompute_time']
+            total_flops = stats['forward_flops'] + \
+                stats['backward_flops'] + stats['recompute_flops']
+            stats.update({'layer': f'{index} {layer}',
+                          'total_time': total_time,
+                          'gflops_per_second': total_flops / total_time
+                          / 1e9 if total_time else 0.0})
+            report.append(stats)
+
+        return report
+
+    def show(self, name='Layer Profile'):
+        """
+            Prints the report as a table, like the model summary
+        """
+        report = self.report()
+        total_time = sum(stats['total_time'] for stats in report)
+
+        print(AsciiTable([[name]]).table)
+        data = [['Layer', 'Calls', 'Forward (ms)', 'Backward (ms)',
+                 'Recomputed (ms)', 'Time (%)', 'Input (MB)',
+                 'Output (MB)', 'GFLOP', 'GFLOP/s']]
+
+        for stats in report:
+            flops = stats['forward_flops'] + stats['backward_flops'] + \
+                stats['recompute_flops']
+            data.append([
+                stats['layer'],
+                stats['forward_calls'],
+                f"{stats['forward_time'] * 1e3:.2f}",
+                f"{stats['backward_time'] * 1e3:.2f}",
+                f"{stats['recompute_time'] * 1e3:.2f}",
+                f"{100 * stats['total_time'] / total_time:.1f}"
+                if total_time else '0.0',
+                f"{stats['input_bytes'] / 2 ** 20:.2f}",
+                f"{stats['output_bytes'] / 2 ** 20:.2f}",
+                f"{flops / 1e9:.3f}",
+                f"{stats['gflops_per_second']:.2f}"
+            ])
+        print(AsciiTable(data).table,
+              f"\nTotal Time {total_time * 1e3:.2f} ms")
+
+    def to_json(self, path=None):
+        """
+            Gives the report as JSON, also writing it to path
+            when one is given
+        """
+        report = json.dumps(self.report(), indent=2)
+
+        if path is not None:
+            with open(path, 'w') as report_file:
+                report_file.write(report)
+
+        return report
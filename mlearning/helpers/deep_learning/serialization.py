@@ -0,0 +1,215 @@
+"""
+    This module contains the saving and loading of networks as a
+    layer manifest and one contiguous weight blob.
+"""
+import json
+import os
+
+import numpy as np
+
+from .layers import (ConvolutionTwoD, Activation, DropOut, BatchNormalization,
+                     Flatten, Dense, ConstantPadding2D, ZeroPadding2D,
+                     UpSampling2D, Reshape)
+
+
+MANIFEST_FILE = 'manifest.json'
+WEIGHTS_FILE = 'weights.npy'
+OPTIMIZER_FILE = 'optimizer.npz'
+FORMAT_VERSION = 1
+
+# Layer models a manifest can name. Register custom layers here
+# to make them loadable
+layer_classes = {layer.__name__: layer for layer in (
+    ConvolutionTwoD, Activation, DropOut, BatchNormalization, Flatten,
+    Dense, ConstantPadding2D, ZeroPadding2D, UpSampling2D, Reshape)}
+
+
+def as_tuples(value):
+    """
+        Turns the lists of a decoded manifest value back into tuples
+    """
+    if isinstance(value, list):
+        return tuple(as_tuples(item) for item in value)
+    if isinstance(value, dict):
+        return {key: as_tuples(item) for key, item in value.items()}
+
+    return value
+
+
+def to_builtin(value):
+    """
+        Converts numpy scalars met while encoding the manifest
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} cannot be saved in a manifest')
+
+
+def saved_arrays(layer):
+    """
+        Gives the (name, array) pairs of the layer parameters and
+        buffers that have been initialised
+    """
+    arrays = []
+
+    for name in layer.params + layer.buffers:
+        value = getattr(layer, name, None)
+        if isinstance(value, np.ndarray):
+            arrays.append((name, value))
+
+    return arrays
+
+
+def save_network(network, path, optimizer_state=False):
+    """
+        Writes the network into the directory at path.
+        The manifest describes every layer and where its arrays sit
+        in a single flat weights blob. With optimizer_state, the
+        optimizer moments and timesteps are written to a separate
+        file for resuming training.
+    """
+    os.makedirs(path, exist_ok=True)
+    layer_entries = []
+    arrays = []
+    offset = 0
+
+    for layer in network.input_layers:
+        array_entries = []
+        for name, array in saved_arrays(layer):
+            array_entries.append({'name': name,
+                                  'shape': array.shape,
+                                  'offset': offset})
+            arrays.append(array.ravel())
+            offset += array.size
+
+        layer_entries.append({'class': type(layer).__name__,
+                              'config': layer.get_config(),
+                              'input_shape': getattr(layer, 'input_shape',
+                                                     None),
+                              'trainable': layer.trainable,
+                              'arrays': array_entries})
+
+    weights = np.empty(offset, dtype=network.dtype)
+    if arrays:
+        np.concatenate(arrays, out=weights)
+    np.save(os.path.join(path, WEIGHTS_FILE), weights)
+
+    manifest = {'format': FORMAT_VERSION,
+                'dtype': network.dtype.str,
+                'size': offset,
+                'layers': layer_entries}
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, default=to_builtin)
+
+    if optimizer_state:
+        save_optimizer_state(network, path)
+
+
+def optimizer_arrays(network, prefix=''):
+    """
+        Gives copies of the moment estimates and timestep of every
+        parameter optimizer, keyed by layer index and parameter name
+    """
+    if network.flat_params is not None:
+        network.flat_params.unpack_state()
+    state = {}
+
+    for index, layer in enumerate(network.input_layers):
+        for name, optimizer in zip(layer.params, layer.param_optimizers()):
+            key = f'{prefix}{index}.{name}'
+            state[f'{key}.timestep'] = np.array(optimizer.timestep)
+            if optimizer.mean is not None:
+                state[f'{key}.mean'] = np.array(optimizer.mean)
+                state[f'{key}.uncentered_variance'] = \
+                    np.array(optimizer.uncentered_variance)
+
+    return state
+
+
+def restore_optimizer_arrays(network, state, prefix=''):
+    """
+        Sets the parameter optimizers from arrays given by
+        optimizer_arrays
+    """
+    for index, layer in enumerate(network.input_layers):
+        for name, optimizer in zip(layer.params, layer.param_optimizers()):
+            key = f'{prefix}{index}.{name}'
+            if f'{key}.timestep' not in state:
+                continue
+            optimizer.timestep = int(state[f'{key}.timestep'])
+            optimizer.mean = optimizer.uncentered_variance = None
+            if f'{key}.mean' in state:
+                optimizer.mean = np.array(state[f'{key}.mean'])
+                optimizer.uncentered_variance = \
+                    np.array(state[f'{key}.uncentered_variance'])
+            # In-place optimizers size their scratch on the next update
+            optimizer.scratch = None
+
+    if network.flat_params is not None:
+        network.flat_params.pack_state()
+
+
+def save_optimizer_state(network, path):
+    """
+        Writes the moment estimates and timestep of every
+        parameter optimizer
+    """
+    np.savez(os.path.join(path, OPTIMIZER_FILE), **optimizer_arrays(network))
+
+
+def load_optimizer_state(network, path):
+    """
+        Restores the parameter optimizers written by
+        save_optimizer_state
+    """
+    with np.load(os.path.join(path, OPTIMIZER_FILE)) as state:
+        restore_optimizer_arrays(network, state)
+
+
+def load_network(network_model, path, optimizer, loss, mmap_mode='r',
+                 optimizer_state=False, **options):
+    """
+        Rebuilds a network saved by save_network.
+        The layer parameters are views of the weights blob. With a
+        mmap_mode the blob is memory-mapped instead of read, so
+        processes loading the same file share one physical copy.
+        'r' maps it read-only, which suits serving. Updates that bind
+        new arrays train on it without touching the file, but those
+        made in place into the weights, by an in-place optimizer or
+        Dense lazy_updates, raise a ValueError; use 'c' or None for
+        them.
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest['format'] != FORMAT_VERSION:
+        raise ValueError(f'Unknown model format: {manifest["format"]}')
+
+    network = network_model(optimizer, loss,
+                            dtype=np.dtype(manifest['dtype']), **options)
+    weights = np.load(os.path.join(path, WEIGHTS_FILE), mmap_mode=mmap_mode)
+
+    for entry in manifest['layers']:
+        if entry['class'] not in layer_classes:
+            raise ValueError(f'Unknown layer model: {entry["class"]}')
+
+        layer = layer_classes[entry['class']](**as_tuples(entry['config']))
+        if entry['input_shape'] is not None:
+            layer.set_input_shape(as_tuples(entry['input_shape']))
+        layer.dtype = network.dtype
+        layer.trainable = entry['trainable']
+
+        for array in entry['arrays']:
+            shape = tuple(array['shape'])
+            start = array['offset']
+            setattr(layer, array['name'], weights[
+                start:start + int(np.prod(shape))].reshape(shape))
+
+        if hasattr(layer, 'set_optimizer'):
+            layer.set_optimizer(optimizer)
+        network.input_layers.append(layer)
+
+    if optimizer_state:
+        load_optimizer_state(network, path)
+
+    return network
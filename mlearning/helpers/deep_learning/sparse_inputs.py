@@ -0,0 +1,48 @@
+"""
+    This module contains the handling of scipy.sparse samples, which
+    networks starting with a Dense layer take in CSR form.
+"""
+import numpy as np
+
+from scipy import sparse
+
+
+def as_samples(X, dtype, contiguous=False):
+    """
+        Casts a batch of samples to the given dtype. Sparse samples
+        stay sparse, in CSR form, and are not copied when they
+        already are
+    """
+    if sparse.issparse(X):
+        return X.tocsr().astype(dtype, copy=False)
+    if contiguous:
+        return np.ascontiguousarray(X, dtype=dtype)
+
+    return np.asarray(X, dtype=dtype)
+
+
+def array_bytes(X):
+    """
+        Gives the bytes held by a dense array, or by the data and
+        index arrays of a sparse matrix
+    """
+    if sparse.issparse(X):
+        X = X.tocsr()
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+
+    return X.nbytes
+
+
+def nonzero_rows_product(X, accumulated_grad):
+    """
+        Gives the rows of X.T.dot(accumulated_grad) that can be
+        non-zero, those of the features present in the CSR batch X,
+        and their indices. The product is found over the present
+        features alone rather than every input feature
+    """
+    rows = np.unique(X.indices)
+    present = sparse.csr_matrix(
+        (X.data, np.searchsorted(rows, X.indices), X.indptr),
+        shape=(X.shape[0], rows.size))
+
+    return rows, present.T.dot(accumulated_grad)
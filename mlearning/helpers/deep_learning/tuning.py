@@ -0,0 +1,132 @@
+"""
+    This module contains the batch size tuner that times short
+    training trials and records the fastest setting for the host.
+"""
+import copy
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+from terminaltables import AsciiTable
+
+from .serialization import optimizer_arrays, restore_optimizer_arrays
+
+
+DEFAULT_CANDIDATES = (16, 32, 64, 128, 256, 512)
+
+
+def host_key(network):
+    """
+        Names the host and model a tuned batch size holds for
+    """
+    layers = ','.join(
+        f'{type(layer).__name__}'
+        f'{tuple(int(size) for size in layer.output_shape())}'
+        for layer in network.input_layers)
+
+    return f'{platform.node()}/{os.cpu_count()}/{network.dtype}/{layers}'
+
+
+def read_cache(path):
+    """
+        Gives the batch sizes recorded in the cache file
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+
+    with open(path) as cache_file:
+        return json.load(cache_file)
+
+
+def write_cache(path, key, batch_size):
+    """
+        Records a tuned batch size in the cache file
+    """
+    cache = read_cache(path)
+    cache[key] = batch_size
+
+    with open(path, 'w') as cache_file:
+        json.dump(cache, cache_file, indent=2)
+
+
+def time_batch_sizes(network, X, y, candidates=DEFAULT_CANDIDATES, steps=5,
+                     max_memory=None):
+    """
+        Times steps training steps of the network over random batches
+        of each candidate size, after one warm-up step.
+        Candidates larger than the data set, or whose estimated peak
+        training memory exceeds max_memory bytes, are skipped.
+
+        The trials train the network for real, so its weights, batch
+        normalization statistics, optimizer state and the numpy RNG
+        are put back once they are done.
+
+        Returns the samples per second and memory of each trial
+    """
+    # Every parameter and buffer, including running statistics not
+    # yet set, which the trials would otherwise leave set
+    weights = [(layer, name, copy.copy(getattr(layer, name, None)))
+               for layer in network.input_layers
+               for name in layer.params + layer.buffers]
+    optimizer_state = optimizer_arrays(network)
+    random_state = np.random.get_state()
+    report = []
+
+    try:
+        for batch_size in sorted(candidates):
+            if batch_size > X.shape[0]:
+                continue
+            memory = network.estimate_training_memory(batch_size)['peak']
+            if max_memory is not None and memory > max_memory:
+                continue
+
+            batches = [network.prepare_batch(
+                (X[idx], y[idx])) for idx in (
+                    np.sort(np.random.randint(X.shape[0], size=batch_size))
+                    for _ in range(steps + 1))]
+            network.train_on_batch(*batches[0])
+
+            start = time.perf_counter()
+            for X_batch, y_batch in batches[1:]:
+                network.train_on_batch(X_batch, y_batch)
+            step_time = (time.perf_counter() - start) / steps
+
+            report.append({'batch_size': batch_size,
+                           'step_time': step_time,
+                           'samples_per_second': batch_size / step_time,
+                           'memory': memory})
+    finally:
+        for layer, name, array in weights:
+            value = getattr(layer, name, None)
+            if isinstance(array, np.ndarray) and \
+                    isinstance(value, np.ndarray) and \
+                    value.shape == array.shape:
+                # Parameters may be views of the flat buffer
+                value[...] = array
+            else:
+                setattr(layer, name, array)
+        restore_optimizer_arrays(network, optimizer_state)
+        np.random.set_state(random_state)
+        network.release_state()
+        if network.workspace is not None:
+            # Drop the buffers the trial batch sizes left behind
+            network.workspace.clear()
+
+    return report
+
+
+def show_report(report):
+    """
+        Prints the trials as a table, like the model summary
+    """
+    data = [['Batch Size', 'Step (ms)', 'Samples / s', 'Memory (MB)']]
+
+    for trial in report:
+        data.append([trial['batch_size'],
+                     f"{trial['step_time'] * 1e3:.2f}",
+                     f"{trial['samples_per_second']:.0f}",
+                     f"{trial['memory'] / 2 ** 20:.2f}"])
+    print(AsciiTable(data).table)
@@ -0,0 +1,63 @@
+"""
+    This module contains the workspace that holds reusable
+    layer buffers across training batches.
+"""
+import numpy as np
+
+
+class Workspace:
+    """
+        Arena of preallocated layer outputs and gradients.
+        Each of a layer's named arrays is backed by one flat buffer.
+        Requests that fit in it get a view of its front, so batches
+        of a repeated size, or a smaller trailing batch, allocate
+        nothing. A larger request or another dtype replaces the
+        buffer, so at most one is kept per name.
+
+        Buffers are only handed out while the workspace is active.
+        The network activates it for the span of a training step,
+        when no returned array outlives the next batch.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+        self.active = False
+        self.allocations = 0
+        self.allocations_saved = 0
+
+    def get(self, owner, name, shape, dtype):
+        """
+            Gives an array of the shape viewing the buffer kept for
+            the owner's named array, allocating a buffer when none
+            is large enough
+        """
+        key = (owner, name)
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(key)
+
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = self.buffers[key] = np.empty(size, dtype=dtype)
+            self.allocations += 1
+        else:
+            self.allocations_saved += 1
+
+        return buffer[:size].reshape(shape)
+
+    def clear(self):
+        """
+            Releases every buffer
+        """
+        self.buffers.clear()
+
+    def report(self):
+        """
+            Gives the number of buffers, their total size in bytes and
+            the allocations made and saved
+        """
+        return {'buffers': len(self.buffers),
+                'bytes': sum(buffer.nbytes
+                             for buffer in self.buffers.values()),
+                'allocations': self.allocations,
+                'allocations_saved': self.allocations_saved
+                }
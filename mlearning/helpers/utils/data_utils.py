@@ -4,7 +4,10 @@
 """
 
 import numpy
+import queue
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from itertools import combinations_with_replacement
 
 
@@ -113,19 +116,164 @@ class Data:
 
         return X_train, X_test, Y_train, Y_test
 
-    def iterate_over_batch(self, X, y=None, batch_size=64):
+    def iterate_over_batch(self, X, y=None, batch_size=64, shuffle=False,
+                           sort_batches=False, drop_last=False):
         """
             Creates a Generator for a batch of given size
+
+            Parameters
+            ----------
+            shuffle: bool
+                Gathers each batch from a fresh permutation of the
+                sample indices instead of walking the data in storage
+                order. Only the batch being gathered is copied, so
+                memory-mapped data is never read whole.
+            sort_batches: bool
+                Sorts the indices of each shuffled batch so the gather
+                reads the data front to back
+            drop_last: bool
+                Leaves out the final batch when it is smaller than
+                batch_size, so every batch has the same shape
+        """
+        no_of_samples = X.shape[0]
+
+        # Drawn on the caller's thread, even when the batches are
+        # gathered by a prefetching thread, to keep seeded runs
+        # reproducible
+        order = numpy.random.permutation(no_of_samples) if shuffle else None
+
+        return self._gather_batches(X, y, batch_size, order,
+                                    sort_batches, drop_last)
+
+    def _gather_batches(self, X, y, batch_size, order, sort_batches,
+                        drop_last):
+        """
+            Yields the batches of X (and y) in the given sample order
         """
         no_of_samples = X.shape[0]
 
         for i in numpy.arange(0, no_of_samples, batch_size):
             start, finish = i, min(i + batch_size, no_of_samples)
 
+            if drop_last and finish - start < batch_size:
+                return
+
+            if order is None:
+                index = slice(start, finish)
+            else:
+                index = order[start:finish]
+                if sort_batches:
+                    index = numpy.sort(index)
+
             if y is not None:
-                yield X[start:finish], y[start:finish]
+                yield X[index], y[index]
+            else:
+                yield X[index]
+
+    def map_over_batch(self, func, X, batch_size, n_threads=1):
+        """
+            Applies func to consecutive batches of X and writes the
+            results into one preallocated array.
+            The output is sized from the result of the first batch.
+
+            Parameters
+            ----------
+            func: callable
+                Maps a batch of samples to a batch of results
+            n_threads: int
+                Number of batches processed concurrently. numpy
+                releases the GIL inside BLAS calls, so threads
+                overlap the heavy products
+        """
+        no_of_samples = X.shape[0]
+        first = func(X[:batch_size])
+
+        output = numpy.empty((no_of_samples,) + first.shape[1:],
+                             dtype=first.dtype)
+        output[:batch_size] = first
+
+        def fill(start):
+            finish = min(start + batch_size, no_of_samples)
+            output[start:finish] = func(X[start:finish])
+
+        starts = range(batch_size, no_of_samples, batch_size)
+
+        if n_threads > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as pool:
+                # Consume the results to raise any errors
+                list(pool.map(fill, starts))
+        else:
+            for start in starts:
+                fill(start)
+
+        return output
+
+    def prefetch(self, batches, buffer_size=2, prepare=None):
+        """
+            Iterates over batches that a background thread reads and
+            prepares ahead of the consumer.
+            At most buffer_size prepared batches are held at a time.
+            Errors raised while producing a batch are raised
+            by the iteration.
+
+            Parameters
+            ----------
+            batches: iterable
+                Source of the batches
+            buffer_size: int
+                Number of batches prepared in advance. 0 prepares
+                each batch in the consumer's thread
+            prepare: callable
+                Applied to each batch before it is queued
+        """
+        prepare = prepare or (lambda batch: batch)
+
+        if buffer_size < 1:
+            for batch in batches:
+                yield prepare(batch)
+            return
+
+        batch_queue = queue.Queue(maxsize=buffer_size)
+        stop = threading.Event()
+        finished = object()
+
+        def put(item):
+            # Gives up once the consumer stops iterating
+            while not stop.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in batches:
+                    if not put(prepare(batch)):
+                        return
+            except BaseException as error:
+                # Includes SystemExit and GeneratorExit raised by the
+                # batch source, so the consumer never waits on a
+                # producer that has died
+                put(error)
             else:
-                yield X[start:finish]
+                put(finished)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                item = batch_queue.get()
+
+                if item is finished:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
 
     def categorize(self, x_value, columns=None):
         """
@@ -0,0 +1,75 @@
+"""
+    This module holds a benchmark of the convolution backward pass
+    col2im step
+"""
+import timeit
+
+import numpy as np
+
+from terminaltables import AsciiTable
+
+from ..helpers.deep_learning.layers import Layer
+
+# (Label, input shape, filter shape, stride) of the layers whose
+# gradients are pushed back to image shape
+benchmark_shapes = [
+    ('CNN conv 1 (8x8)', (256, 1, 8, 8), (3, 3), 1),
+    ('CNN conv 2 (8x8)', (256, 16, 8, 8), (3, 3), 1),
+    ('DCGAN disc conv 1 (28x28)', (64, 1, 28, 28), (3, 3), 2),
+    ('DCGAN disc conv 2 (14x14)', (64, 32, 14, 14), (3, 3), 2),
+    ('DCGAN gen conv 2 (28x28)', (16, 128, 28, 28), (3, 3), 1),
+]
+
+
+def scatter_col_to_image(cols, imgs_shape, fltr_shape, stride):
+    """
+        Reference col2im that scatters the columns with np.add.at
+    """
+    batch_size, channels, height, width = imgs_shape
+    pad_h, pad_w = Layer.get_padding(fltr_shape)
+
+    padded_imgs = np.zeros((batch_size, channels,
+                            height + np.sum(pad_h), width + np.sum(pad_w)))
+    ind_a, ind_b, ind_c = Layer.get_img_cols_indices(
+        imgs_shape, fltr_shape, (pad_h, pad_w), stride)
+
+    cols_reshaped = cols.reshape(
+        channels * np.prod(fltr_shape), -1, batch_size).transpose(2, 0, 1)
+    np.add.at(padded_imgs, (slice(None), ind_a, ind_b, ind_c), cols_reshaped)
+
+    return padded_imgs[:, :, pad_h[0]:height +
+                       pad_h[0], pad_w[0]:width + pad_w[0]]
+
+
+def benchmark_col2im(repeats=5):
+    """
+        Times the np.add.at scatter against the strided accumulator
+        on the CNN script and DCGAN layer shapes
+    """
+    data = [['Layer', 'Input Shape', 'add.at (ms)', 'Strided (ms)',
+             'Speedup']]
+
+    for label, imgs_shape, fltr_shape, stride in benchmark_shapes:
+        cols = Layer.reshape_image_to_col(
+            np.random.normal(size=imgs_shape), fltr_shape, stride)
+
+        scattered = scatter_col_to_image(cols, imgs_shape, fltr_shape, stride)
+        accumulated = Layer.reshape_col_to_image(
+            cols, imgs_shape, fltr_shape, stride)
+        assert np.allclose(scattered, accumulated)
+
+        scatter_time = min(timeit.repeat(
+            lambda: scatter_col_to_image(
+                cols, imgs_shape, fltr_shape, stride),
+            number=1, repeat=repeats))
+        strided_time = min(timeit.repeat(
+            lambda: Layer.reshape_col_to_image(
+                cols, imgs_shape, fltr_shape, stride),
+            number=1, repeat=repeats))
+
+        data.append([label, imgs_shape,
+                     f'{scatter_time * 1e3:.2f}',
+                     f'{strided_time * 1e3:.2f}',
+                     f'{scatter_time / strided_time:.1f}x'])
+
+    print(AsciiTable(data).table)
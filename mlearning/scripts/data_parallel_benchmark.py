@@ -0,0 +1,80 @@
+"""
+    This module holds a benchmark of the scaling of data-parallel
+    training over worker processes
+"""
+import os
+import time
+
+import numpy as np
+
+from terminaltables import AsciiTable
+
+from ..deep_learning.grad_optimizers import Adam
+from ..helpers.deep_learning.network import Neural_Network
+from ..helpers.deep_learning.loss import CrossEntropyLoss
+from ..helpers.deep_learning.layers import Dense, Activation
+from ..helpers.deep_learning.parallel import DataParallelTrainer
+
+
+def build_benchmark_network(input_size, classes):
+    """
+        Creates a multilayer perceptron of the size trained by the
+        repository's scripts
+    """
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+
+    model.add_layer(Dense(512, input_shape=(input_size,)))
+    model.add_layer(Activation('leaky_relu'))
+    model.add_layer(Dense(256))
+    model.add_layer(Activation('leaky_relu'))
+    model.add_layer(Dense(classes))
+    model.add_layer(Activation('softmax'))
+
+    return model
+
+
+def benchmark_data_parallel(worker_counts=(1, 2, 4, 8), batch_size=512,
+                            steps=20, input_size=784, classes=10):
+    """
+        Times training steps with each number of worker processes and
+        reports the speedup over one process and the scaling
+        efficiency, speedup / workers.
+
+        Each process is limited to its share of the cores in BLAS
+        threads, so one worker runs with every core. More workers
+        only speed training up on hosts with at least as many cores
+        as workers; with fewer, the speedup falls below 1x, as the
+        processes share the cores and add the copy of the batch and
+        the gradient reduction. See DataParallelTrainer
+    """
+    X = np.random.normal(size=(batch_size, input_size))
+    y = np.eye(classes)[np.random.randint(classes, size=batch_size)]
+
+    data = [['Workers', 'BLAS Threads', 'Step (ms)', 'Samples / s',
+             'Speedup', 'Efficiency']]
+    base_time = None
+
+    for workers in worker_counts:
+        np.random.seed(0)
+        model = build_benchmark_network(input_size, classes)
+
+        with DataParallelTrainer(model, workers, batch_size) as trainer:
+            blas_threads = trainer.blas_threads
+            # Warm up the replicas and the shared buffers
+            trainer.train_on_batch(X, y)
+            start = time.perf_counter()
+            for _ in range(steps):
+                trainer.train_on_batch(X, y)
+            step_time = (time.perf_counter() - start) / steps
+
+        base_time = base_time or step_time
+        speedup = base_time / step_time
+        data.append([workers,
+                     blas_threads,
+                     f'{step_time * 1e3:.2f}',
+                     f'{batch_size / step_time:.0f}',
+                     f'{speedup:.2f}x',
+                     f'{100 * speedup / workers:.0f}%'])
+
+    print(AsciiTable(data).table,
+          f"\nCores {os.cpu_count()}")
@@ -23,7 +23,8 @@ class DCGAN:
 
     """
 
-    def __init__(self, optimizer=Adam, loss_function=CrossEntropyLoss):
+    def __init__(self, optimizer=Adam, loss_function=CrossEntropyLoss,
+                 gradient_checkpointing=False):
         self.image_rows = 28
         self.image_cols = 28
         self.channels = 1
@@ -40,6 +41,11 @@ class DCGAN:
         self.combined = Neural_Network(optimizer, loss_function)
 
         self.extend_layers()
+        if gradient_checkpointing:
+            # Recompute activations in the backward passes to fit
+            # larger images or batches
+            for model in (self.discriminator, self.combined):
+                model.enable_gradient_checkpointing()
         self.summarize()
 
     def build_discriminator(self, optimizer, loss_function
@@ -119,16 +125,26 @@ class DCGAN:
 
         return model
 
-    def train(self, X, y, epochs, batch_size=128, save_interval=50):
+    def train(self, X, y, epochs, batch_size=128, save_interval=50,
+              checkpoint=None):
         """
-            Trains the model
+            Trains the model.
+            With a Checkpointer the training state is saved every
+            checkpoint.interval epochs and training resumes from the
+            checkpoint when it already holds one
         """
 
         X = X.reshape((-1, ) + self.img_shape)
         self.X = (X.astype(np.float32) - 127.5) / 127.5
         self.y = y
 
-        for epoch in range(epochs):
+        networks = {'generator': self.gen,
+                    'discriminator': self.discriminator}
+        start_epoch = 0
+        if checkpoint is not None:
+            start_epoch, _ = checkpoint.restore(networks)
+
+        for epoch in range(start_epoch, epochs):
             self.train_discriminator(batch_size // 2)
             self.train_gen(batch_size)
             disp = f'{epoch}  [Discriminator: loss -' + \
@@ -140,6 +156,12 @@ class DCGAN:
             if not epoch % save_interval:
                 self.save(epoch)
 
+            if checkpoint is not None:
+                checkpoint.on_epoch_end(networks, epoch, epochs)
+
+        if checkpoint is not None:
+            checkpoint.wait()
+
     def train_discriminator(self, half_batch):
         """
             Trains the discriminator
@@ -27,7 +27,9 @@ class Generative_Adversarial_Net:
             Number of image columns
         model_data: dict
             {'no_of_epochs':222int 'batch_size': 128, 'save_interval':50}
-            To be used in training the network
+            To be used in training the network.
+            A 'checkpoint': Checkpointer entry makes the training
+            resumable
     """
     sample_input = {'no_of_epochs': 30000,
                     'batch_size': 32,
@@ -110,6 +112,7 @@ class Generative_Adversarial_Net:
         no_of_epochs = kwargs.get('no_of_epochs')
         batch_size = kwargs.get('batch_size') or 128
         save_interval = kwargs.get('save_interval') or 50
+        checkpoint = kwargs.get('checkpoint')
 
         mnist = fetch_mldata('MNIST original')
 
@@ -119,7 +122,13 @@ class Generative_Adversarial_Net:
         X = (X.astype(np.float32) - 127.5) / 127.5
         half_batch = batch_size // 2
 
-        for epoch in range(no_of_epochs):
+        networks = {'generator': self.generator,
+                    'discriminator': self.discriminator}
+        start_epoch = 0
+        if checkpoint is not None:
+            start_epoch, _ = checkpoint.restore(networks)
+
+        for epoch in range(start_epoch, no_of_epochs):
 
             self.train_discriminator(X, half_batch, epoch)
             self.train_gen(X, batch_size)
@@ -127,6 +136,12 @@ class Generative_Adversarial_Net:
             if not epoch % save_interval:
                 self.save_samples(epoch)
 
+            if checkpoint is not None:
+                checkpoint.on_epoch_end(networks, epoch, no_of_epochs)
+
+        if checkpoint is not None:
+            checkpoint.wait()
+
     def save_samples(self, epoch):
         """
             Saves generated sample images at the save interval
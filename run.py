@@ -19,6 +19,8 @@ from mlearning.scripts.multilayer_perceptron import m_perceptron
 from mlearning.scripts.fp_growth import grow_frequent_pattern
 from mlearning.scripts.autoencoder import autoencoder
 from mlearning.scripts.adaboost import adaboost
+from mlearning.scripts.col2im_benchmark import benchmark_col2im
+from mlearning.scripts.data_parallel_benchmark import benchmark_data_parallel
 
 if __name__ == '__main__':
     # regress_polynomial()
@@ -39,4 +41,6 @@ if __name__ == '__main__':
     # m_perceptron()
     # grow_frequent_pattern()
     # autoencoder()
+    # benchmark_col2im()
+    # benchmark_data_parallel()
     adaboost()
@@ -0,0 +1,64 @@
+"""
+    Tests of training from batch sources
+"""
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.layers import Activation, Dense
+
+
+random_state = np.random.RandomState(0)
+X = random_state.normal(size=(32, 5))
+y = np.eye(3)[random_state.randint(3, size=32)]
+
+
+def build():
+    np.random.seed(0)
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(Dense(3, input_shape=(5,)))
+    model.add_layer(Activation('softmax'))
+
+    return model
+
+
+def batches():
+    for start in range(0, 32, 8):
+        yield X[start:start + 8], y[start:start + 8]
+
+
+class TestBatchSources(unittest.TestCase):
+
+    def test_sources_train_like_arrays(self):
+        model = build()
+        model.fit(X, y, 3, batch_size=8)
+
+        for source in (batches, list(batches())):
+            with self.subTest(source=type(source).__name__):
+                trained = build()
+                trained.fit(source, None, 3, batch_size=8)
+                np.testing.assert_array_equal(
+                    trained.input_layers[0].weight,
+                    model.input_layers[0].weight)
+
+    def test_one_shot_iterator_trains_one_epoch(self):
+        model = build()
+        model.fit(batches(), None, 1, batch_size=8)
+
+        self.assertEqual(len(model.errs['training']), 1)
+        self.assertTrue(np.isfinite(model.errs['training'][0]))
+
+    def test_one_shot_iterator_refuses_several_epochs(self):
+        model = build()
+        weight = np.array(model.input_layers[0].weight)
+
+        with self.assertRaises(ValueError):
+            model.fit(batches(), None, 2, batch_size=8)
+        np.testing.assert_array_equal(model.input_layers[0].weight, weight)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+    Tests of resuming training from checkpoints
+"""
+import tempfile
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.layers import (
+    Activation, DropOut, BatchNormalization, Dense)
+from mlearning.helpers.deep_learning.checkpoint import Checkpointer
+from mlearning.helpers.deep_learning.early_stopping import EarlyStopping
+
+
+random_state = np.random.RandomState(1)
+X = random_state.normal(size=(48, 6))
+y = np.eye(3)[random_state.randint(3, size=48)]
+X_valid = random_state.normal(size=(30, 6))
+y_valid = np.eye(3)[random_state.randint(3, size=30)]
+
+
+def build(flat=False, threads=1):
+    np.random.seed(0)
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss,
+                           validation_data=(X_valid, y_valid),
+                           threads=threads)
+    model.add_layer(Dense(8, input_shape=(6,)))
+    model.add_layer(BatchNormalization())
+    model.add_layer(Activation('ReLu'))
+    model.add_layer(DropOut(0.2))
+    model.add_layer(Dense(3))
+    model.add_layer(Activation('softmax'))
+    if flat:
+        model.flatten_parameters()
+
+    return model
+
+
+class TestCheckpointResume(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_resume_matches(self, options=None, fit_options=None,
+                              epochs=4, interrupted_at=2):
+        """
+            Trains one network without interruption, and another that
+            stops after interrupted_at epochs and resumes from its
+            checkpoint in a fresh network
+        """
+        options = options or {}
+        fit_options = dict(batch_size=16, shuffle=True, **(fit_options or {}))
+        path = tempfile.mkdtemp(dir=self.path)
+
+        uninterrupted = build(**options)
+        uninterrupted.fit(X, y, epochs, **fit_options)
+
+        build(**options).fit(X, y, interrupted_at,
+                             checkpoint=Checkpointer(path),
+                             **fit_options)
+        resumed = build(**options)
+        resumed.fit(X, y, epochs, checkpoint=Checkpointer(path),
+                    **fit_options)
+
+        for layer, resumed_layer in zip(uninterrupted.input_layers,
+                                        resumed.input_layers):
+            for name in layer.params + layer.buffers:
+                np.testing.assert_array_equal(getattr(resumed_layer, name),
+                                              getattr(layer, name))
+        for kind, errs in uninterrupted.errs.items():
+            np.testing.assert_array_equal(resumed.errs[kind], errs)
+
+        return uninterrupted, resumed
+
+    def test_resume_matches_uninterrupted_run(self):
+        for options in ({}, {'flat': True}, {'threads': 2}):
+            with self.subTest(options=options):
+                self.assert_resume_matches(options)
+
+    def test_resume_keeps_validation_subset(self):
+        # Equal validation losses show the same subset was evaluated,
+        # and so the same early stopping counters
+        early_stopping = EarlyStopping(patience=10,
+                                       restore_best_weights=False)
+        self.assert_resume_matches(fit_options={
+            'validation_samples': 10, 'early_stopping': early_stopping})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+    Tests of the ConvolutionTwoD algorithms against finite differences
+"""
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.layers import ConvolutionTwoD
+
+
+# (algorithm, im2col, filter_shape, stride, padding)
+geometries = [
+    ('matmul', 'gather', (3, 3), 1, True),
+    ('matmul', 'gather', (2, 2), 2, False),
+    ('matmul', 'strided', (3, 3), 2, True),
+    ('matmul', 'strided', (2, 3), 1, True),
+    ('fft', 'gather', (3, 3), 1, True),
+    ('fft', 'gather', (3, 2), 2, False),
+    ('winograd', 'gather', (3, 3), 1, True),
+    ('winograd', 'gather', (3, 3), 1, False),
+]
+
+
+def make_layer(algorithm, im2col, filter_shape, stride, padding,
+               input_shape=(2, 6, 7)):
+    np.random.seed(0)
+    layer = ConvolutionTwoD(3, filter_shape, input_shape=input_shape,
+                            padding=padding, stride=stride, im2col=im2col,
+                            algorithm=algorithm)
+    layer.init_weights(optimizer=Adam())
+    layer.weight_out = np.random.normal(size=layer.weight_out.shape)
+
+    return layer
+
+
+def numerical_gradient(loss, array, eps=1e-6):
+    """
+        Central differences of loss() with respect to each element
+        of array, changed in place
+    """
+    grad = np.zeros_like(array)
+
+    for index in np.ndindex(array.shape):
+        value = array[index]
+        array[index] = value + eps
+        loss_plus = loss()
+        array[index] = value - eps
+        loss_minus = loss()
+        array[index] = value
+        grad[index] = (loss_plus - loss_minus) / (2 * eps)
+
+    return grad
+
+
+class TestConvolutionGradients(unittest.TestCase):
+
+    def check_gradients(self, geometry):
+        layer = make_layer(*geometry)
+        X = np.random.normal(size=(2,) + layer.input_shape)
+        output_grad = np.random.normal(
+            size=(X.shape[0],) + layer.output_shape())
+
+        def loss():
+            return np.sum(layer.forward_pass(X, training=False) *
+                          output_grad)
+
+        # The gradients are collected instead of applied
+        grad_weight = np.zeros_like(layer.weight_)
+        grad_weight_out = np.zeros_like(layer.weight_out)
+        layer.grad_views = [grad_weight, grad_weight_out]
+
+        layer.forward_pass(X)
+        input_grad = layer.backward_pass(output_grad)
+
+        np.testing.assert_allclose(
+            input_grad, numerical_gradient(loss, X), rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(
+            grad_weight, numerical_gradient(loss, layer.weight_),
+            rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(
+            grad_weight_out, numerical_gradient(loss, layer.weight_out),
+            rtol=1e-5, atol=1e-7)
+
+    def test_gradients_match_finite_differences(self):
+        for geometry in geometries:
+            with self.subTest(geometry=geometry):
+                self.check_gradients(geometry)
+
+    def test_algorithms_match_gather(self):
+        for geometry in geometries[1:]:
+            with self.subTest(geometry=geometry):
+                layer = make_layer(*geometry)
+                reference = make_layer('matmul', 'gather', *geometry[2:])
+                X = np.random.normal(size=(3,) + layer.input_shape)
+
+                np.testing.assert_allclose(
+                    layer.forward_pass(X, training=False),
+                    reference.forward_pass(X, training=False),
+                    rtol=1e-10, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
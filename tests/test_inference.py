@@ -0,0 +1,86 @@
+"""
+    Tests of the inference plans networks compile into
+"""
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.layers import (
+    ConvolutionTwoD, Activation, DropOut, BatchNormalization, Flatten, Dense)
+
+
+def perceptron():
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(Dense(16, input_shape=(10,)))
+    model.add_layer(BatchNormalization())
+    model.add_layer(Activation('ReLu'))
+    model.add_layer(DropOut(0.25))
+    model.add_layer(Dense(16))
+    model.add_layer(Activation('tanh'))
+    model.add_layer(BatchNormalization())
+    model.add_layer(Dense(4))
+    model.add_layer(Activation('softmax'))
+
+    return model, (10,)
+
+
+def convolutional():
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(ConvolutionTwoD(4, (3, 3), input_shape=(1, 6, 6)))
+    model.add_layer(BatchNormalization())
+    model.add_layer(Activation('leaky_relu'))
+    model.add_layer(DropOut(0.2))
+    model.add_layer(ConvolutionTwoD(3, (3, 3), stride=2,
+                                    algorithm='fft'))
+    model.add_layer(Activation('sigmoid'))
+    model.add_layer(Flatten())
+    model.add_layer(Dense(4))
+    model.add_layer(Activation('softmax'))
+
+    return model, (1, 6, 6)
+
+
+def trained(build):
+    np.random.seed(0)
+    model, input_shape = build()
+    X = np.random.normal(size=(32,) + input_shape)
+    y = np.eye(4)[np.random.randint(4, size=32)]
+    for _ in range(3):
+        model.train_on_batch(X, y)
+    model.release_state()
+
+    return model, np.random.normal(size=(20,) + input_shape), X, y
+
+
+class TestInferencePlan(unittest.TestCase):
+
+    def test_predictions_match_network(self):
+        for build in (perceptron, convolutional):
+            with self.subTest(network=build.__name__):
+                model, X, _, _ = trained(build)
+                plan = model.compile_for_inference()
+
+                np.testing.assert_allclose(plan.make_prediction(X),
+                                           model.make_prediction(X),
+                                           rtol=1e-10, atol=1e-12)
+                np.testing.assert_allclose(
+                    plan.make_prediction(X, batch_size=6),
+                    model.make_prediction(X), rtol=1e-10, atol=1e-12)
+
+    def test_plan_is_frozen(self):
+        model, X, X_train, y_train = trained(perceptron)
+        plan = model.compile_for_inference()
+        prediction = plan.make_prediction(X)
+
+        model.train_on_batch(X_train, y_train)
+
+        np.testing.assert_array_equal(plan.make_prediction(X), prediction)
+        with self.assertRaises(AttributeError):
+            plan.steps = ()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+    Tests of the activation memory estimates
+"""
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.layers import (
+    ConvolutionTwoD, Activation, Flatten, Reshape, Dense)
+
+
+def perceptron():
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(Dense(64, input_shape=(32,)))
+    model.add_layer(Activation('ReLu'))
+    model.add_layer(Reshape((4, 16)))
+    model.add_layer(Flatten())
+    model.add_layer(Dense(10))
+
+    return model, (32,)
+
+
+def convolutional():
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(ConvolutionTwoD(4, (3, 3), input_shape=(1, 8, 8)))
+    model.add_layer(Activation('ReLu'))
+    model.add_layer(Flatten())
+    model.add_layer(Dense(10))
+
+    return model, (1, 8, 8)
+
+
+def flattened_convolution(algorithm):
+    def build():
+        model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+        model.add_layer(ConvolutionTwoD(4, (3, 3), input_shape=(1, 8, 8),
+                                        algorithm=algorithm))
+        # Copies the transposed matmul output, views the others
+        model.add_layer(Flatten())
+        model.add_layer(Dense(10))
+
+        return model, (1, 8, 8)
+
+    build.__name__ = f'flattened_{algorithm}_convolution'
+
+    return build
+
+
+def traced_forward_pass(model, X):
+    """
+        Gives the bytes a training forward pass leaves allocated,
+        and the most it allocated at once
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        output = model.run_forward_pass(X)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del output
+
+    return current - before, peak - before
+
+
+class TestActivationEstimates(unittest.TestCase):
+
+    def test_estimate_matches_allocations(self):
+        for build in (perceptron, convolutional,
+                      flattened_convolution('fft')):
+            with self.subTest(network=build.__name__):
+                model, input_shape = build()
+                X = np.random.normal(size=(256,) + input_shape)
+
+                # Training keeps every layer's intermediates alive
+                measured, _ = traced_forward_pass(model, X)
+                estimated = X.shape[0] * model.activation_bytes_per_sample()
+                self.assertAlmostEqual(estimated / measured, 1, delta=0.1)
+
+    def test_views_create_no_activations(self):
+        model, _ = perceptron()
+
+        self.assertEqual(model.input_layers[2].activation_elements(), 0)
+        self.assertEqual(model.input_layers[3].activation_elements(), 0)
+
+    def test_flatten_copies_non_contiguous_input(self):
+        model, input_shape = flattened_convolution('matmul')()
+        X = np.random.normal(size=(256,) + input_shape)
+        retained, peak = traced_forward_pass(model, X)
+        estimated = X.shape[0] * model.activation_bytes_per_sample()
+
+        self.assertEqual(model.activation_elements()[1], 4 * 8 * 8)
+        # The convolution output is dropped once copied, but both
+        # are held while the copy is made
+        self.assertGreater(estimated, retained)
+        self.assertAlmostEqual(estimated / peak, 1, delta=0.1)
+
+        model, _ = flattened_convolution('fft')()
+        self.assertEqual(model.activation_elements()[1], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
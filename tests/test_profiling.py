@@ -0,0 +1,60 @@
+"""
+    Tests of the per-layer profiler
+"""
+import unittest
+
+import numpy as np
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import MSE
+from mlearning.helpers.deep_learning.layers import Activation, Dense
+
+
+def build(threads=1):
+    np.random.seed(0)
+    model = Neural_Network(optimizer=Adam(), loss=MSE,
+                           threads=threads)
+    model.add_layer(Dense(16, input_shape=(8,)))
+    for _ in range(2):
+        model.add_layer(Activation('tanh'))
+        model.add_layer(Dense(16))
+    model.add_layer(Activation('sigmoid'))
+
+    return model
+
+
+X = np.random.RandomState(0).normal(size=(64, 8))
+y = np.random.RandomState(1).uniform(size=(64, 16))
+
+
+class TestLayerProfiler(unittest.TestCase):
+
+    def test_thread_replicas_count_every_call(self):
+        model = build(threads=4)
+        profiler = model.enable_profiling()
+        for _ in range(20):
+            model.train_on_batch(X, y)
+
+        for stats in profiler.report():
+            self.assertEqual(stats['forward_calls'], 80)
+            self.assertEqual(stats['backward_calls'], 80)
+
+    def test_recomputed_passes_are_kept_apart(self):
+        model = build()
+        model.enable_gradient_checkpointing([2, 4])
+        profiler = model.enable_profiling()
+        model.train_on_batch(X, y)
+        report = profiler.report()
+
+        self.assertEqual([stats['forward_calls'] for stats in report],
+                         [1] * 6)
+        # The last segment is differentiated without recomputation
+        self.assertEqual([stats['recompute_calls'] for stats in report],
+                         [1, 1, 1, 1, 0, 0])
+        self.assertEqual(report[0]['forward_flops'],
+                         report[0]['recompute_flops'])
+
+
+if __name__ == '__main__':
+    unittest.main()
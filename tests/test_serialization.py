@@ -0,0 +1,128 @@
+"""
+    Tests of saving and loading networks
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.serialization import WEIGHTS_FILE
+from mlearning.helpers.deep_learning.layers import (
+    ConvolutionTwoD, Activation, BatchNormalization, Flatten, Dense)
+
+
+def build(dtype=np.float64):
+    np.random.seed(0)
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss,
+                           dtype=dtype)
+    model.add_layer(ConvolutionTwoD(3, (3, 3), input_shape=(1, 5, 5),
+                                    im2col='strided'))
+    model.add_layer(Activation('ReLu'))
+    model.add_layer(Flatten())
+    model.add_layer(Dense(8))
+    model.add_layer(BatchNormalization())
+    model.add_layer(Activation('tanh'))
+    model.add_layer(Dense(3))
+    model.add_layer(Activation('softmax'))
+
+    return model
+
+
+def data(samples=16):
+    X = np.random.normal(size=(samples, 1, 5, 5))
+    y = np.eye(3)[np.random.randint(3, size=samples)]
+
+    return X, y
+
+
+class TestSerialization(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_predicts_the_same(self):
+        for dtype in (np.float64, np.float32):
+            for mmap_mode in ('r', None):
+                with self.subTest(dtype=dtype, mmap_mode=mmap_mode):
+                    model = build(dtype)
+                    X, y = data()
+                    model.train_on_batch(X, y)
+                    model.save(self.path)
+
+                    loaded = Neural_Network.load(
+                        self.path, Adam(), CrossEntropyLoss,
+                        mmap_mode=mmap_mode)
+
+                    self.assertEqual(loaded.dtype, np.dtype(dtype))
+                    self.assertEqual(
+                        [layer.get_config() for layer in loaded.input_layers],
+                        [layer.get_config() for layer in model.input_layers])
+                    np.testing.assert_array_equal(
+                        loaded.make_prediction(X), model.make_prediction(X))
+
+    def test_read_only_map_refuses_in_place_updates(self):
+        build().save(self.path)
+        X, y = data()
+        loaded = Neural_Network.load(self.path, Adam(inplace=True),
+                                     CrossEntropyLoss)
+
+        with self.assertRaises(ValueError):
+            loaded.train_on_batch(X, y)
+
+    def test_read_only_map_refuses_lazy_updates(self):
+        model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+        model.add_layer(Dense(3, input_shape=(20,), lazy_updates=True))
+        model.add_layer(Activation('softmax'))
+        model.save(self.path)
+        loaded = Neural_Network.load(self.path, Adam(), CrossEntropyLoss)
+        X = sparse.random(8, 20, density=0.2, format='csr')
+        y = np.eye(3)[np.random.randint(3, size=8)]
+
+        with self.assertRaises(ValueError):
+            loaded.train_on_batch(X, y)
+
+    def test_training_leaves_the_file_unchanged(self):
+        build().save(self.path)
+        weights_path = os.path.join(self.path, WEIGHTS_FILE)
+        with open(weights_path, 'rb') as weights_file:
+            saved = weights_file.read()
+        X, y = data()
+
+        for flat in (False, True):
+            with self.subTest(flat=flat):
+                loaded = Neural_Network.load(self.path, Adam(),
+                                             CrossEntropyLoss)
+                if flat:
+                    loaded.flatten_parameters()
+                loaded.train_on_batch(X, y)
+
+                with open(weights_path, 'rb') as weights_file:
+                    self.assertEqual(weights_file.read(), saved)
+
+    def test_optimizer_state_resumes_training(self):
+        model = build()
+        X, y = data()
+        model.train_on_batch(X, y)
+        model.save(self.path, optimizer_state=True)
+        loaded = Neural_Network.load(self.path, Adam(), CrossEntropyLoss,
+                                     mmap_mode=None, optimizer_state=True)
+
+        for _ in range(3):
+            model.train_on_batch(X, y)
+            loaded.train_on_batch(X, y)
+
+        np.testing.assert_allclose(loaded.make_prediction(X),
+                                   model.make_prediction(X), rtol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
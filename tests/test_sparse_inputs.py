@@ -0,0 +1,63 @@
+"""
+    Tests of sparse input batches
+"""
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from mlearning.deep_learning.grad_optimizers import Adam
+from mlearning.helpers.deep_learning.network import Neural_Network
+from mlearning.helpers.deep_learning.loss import CrossEntropyLoss
+from mlearning.helpers.deep_learning.layers import Activation, Dense
+
+
+def build(lazy_updates=False):
+    np.random.seed(0)
+    model = Neural_Network(optimizer=Adam(), loss=CrossEntropyLoss)
+    model.add_layer(Dense(8, input_shape=(50,), lazy_updates=lazy_updates))
+    model.add_layer(Activation('tanh'))
+    model.add_layer(Dense(3))
+    model.add_layer(Activation('softmax'))
+
+    return model
+
+
+random_state = np.random.RandomState(3)
+X = sparse.random(30, 50, density=0.05, random_state=random_state,
+                  format='csr')
+y = np.eye(3)[random_state.randint(3, size=30)]
+
+
+def train(model, dense):
+    # Batches with different features present
+    for start in range(0, 30, 6):
+        X_batch = X[start:start + 6]
+        model.train_on_batch(X_batch.toarray() if dense else X_batch,
+                             y[start:start + 6])
+
+    return model.input_layers[0].weight
+
+
+class TestSparseDense(unittest.TestCase):
+
+    def test_sparse_batches_train_like_dense(self):
+        np.testing.assert_allclose(train(build(), dense=False),
+                                   train(build(), dense=True),
+                                   rtol=1e-12, atol=1e-15)
+
+    def test_lazy_updates_leave_absent_rows(self):
+        model = build(lazy_updates=True)
+        weight = np.array(model.input_layers[0].weight)
+        X_batch = X[:6]
+        model.train_on_batch(X_batch, y[:6])
+
+        absent = np.setdiff1d(np.arange(50), X_batch.indices)
+        np.testing.assert_array_equal(model.input_layers[0].weight[absent],
+                                      weight[absent])
+        self.assertFalse(np.allclose(train(build(lazy_updates=True), False),
+                                     train(build(), dense=True)))
+
+
+if __name__ == '__main__':
+    unittest.main()